@@ -0,0 +1,162 @@
+# admission.py
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict, deque
+
+from modqueue import TokenBucket
+
+logger = logging.getLogger('discord')
+
+# What to do when the pending queue is full
+DROP_OLDEST = "drop-oldest" # the message that has waited longest is degraded to make room for the new one
+SAMPLE = "sample" # only one new message in sample_every gets in (displacing the oldest); the rest are degraded
+
+
+class AdmissionController:
+    '''
+    Backpressure for the auto-flag path. Every group channel message goes through here instead of straight to the
+    classifier, and waits in a bounded pending queue for one of `workers` slots to run the full check (run_full:
+    text scorer plus image classifier). Each message also spends a token from its author's and its channel's
+    bucket. Those are only enforced once the queue is full: then a message from an author or channel over their
+    rate is the one shed, before the queue's policy displaces anyone else. Until then, everything gets in.
+
+    A message that can't have a full check gets run_degraded(message, reason) instead, which only uses cheap,
+    local heuristics: when its author or channel is over their rate, when the queue is full (see DROP_OLDEST and
+    SAMPLE), or when it waited longer than max_wait. Degraded checks run one at a time from a second bounded
+    queue; if even that is full (max_degraded), the message goes unchecked, counted as `unchecked` and passed
+    to on_unchecked(message) if given. So memory
+    stays bounded by max_pending + max_degraded however fast a raid posts. Every decision is counted in `stats`
+    by reason.
+    '''
+
+    def __init__(self, run_full, run_degraded, workers=8, max_pending=200, policy=DROP_OLDEST, sample_every=4,
+                 author_rate=(5, 10), channel_rate=(60, 10), max_wait=30, max_buckets=10000, max_degraded=1000,
+                 on_unchecked=None):
+        self.run_full = run_full
+        self.run_degraded = run_degraded
+        self.workers = workers
+        self.max_pending = max_pending
+        self.policy = policy
+        self.sample_every = sample_every
+        self.author_rate = author_rate # (messages, per seconds) for each author
+        self.channel_rate = channel_rate # (messages, per seconds) for each channel
+        self.max_wait = max_wait
+        self.max_buckets = max_buckets
+        self.max_degraded = max_degraded
+        self.on_unchecked = on_unchecked
+
+        self.buckets = OrderedDict() # ("author" | "channel", ID) -> TokenBucket, least recently used first
+        self.pending = deque() # (message, time queued), oldest first
+        self.ready = asyncio.Event()
+        self.worker_tasks = []
+        self.active = 0 # messages getting a full check right now
+        self.degraded = deque() # (message, reason) waiting for a degraded check
+        self.degraded_ready = asyncio.Event()
+        self.degraded_active = False
+        self.saturated_seen = 0
+        self.stats = Counter()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def idle(self):
+        return not self.pending and not self.active and not self.degraded and not self.degraded_active
+
+    def start(self):
+        if not self.worker_tasks:
+            self.worker_tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+            # No I/O before the report is filed, so one worker keeps up with what the full checks can't
+            self.worker_tasks.append(asyncio.create_task(self.work_degraded()))
+
+    def stop(self):
+        for task in self.worker_tasks:
+            task.cancel()
+        self.worker_tasks = []
+
+    def bucket(self, kind, key):
+        bucket = self.buckets.get((kind, key))
+        if bucket is None:
+            rate, per = self.author_rate if kind == "author" else self.channel_rate
+            bucket = self.buckets[(kind, key)] = TokenBucket(rate, per)
+            while len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end((kind, key))
+        return bucket
+
+    def submit(self, message):
+        '''Admits a message for a full check or hands it to the degraded path. Never blocks.'''
+        self.stats['received'] += 1
+        author_ok = self.bucket("author", message.author.id).try_acquire()
+        channel_ok = self.bucket("channel", message.channel.id).try_acquire()
+
+        if len(self.pending) >= self.max_pending:
+            if not author_ok:
+                return self.degrade(message, "author_rate")
+            if not channel_ok:
+                return self.degrade(message, "channel_rate")
+            if self.policy == SAMPLE:
+                self.saturated_seen += 1
+                if self.saturated_seen % self.sample_every:
+                    return self.degrade(message, "sampled_out")
+            oldest, _ = self.pending.popleft()
+            self.degrade(oldest, "dropped_oldest")
+        else:
+            self.saturated_seen = 0
+
+        self.pending.append((message, time.monotonic()))
+        self.stats['admitted'] += 1
+        self.stats['max_pending'] = max(self.stats['max_pending'], len(self.pending))
+        self.ready.set()
+
+    def degrade(self, message, reason):
+        self.stats[f'degraded_{reason}'] += 1
+        if len(self.degraded) >= self.max_degraded:
+            self.stats['unchecked'] += 1
+            if self.on_unchecked:
+                self.on_unchecked(message)
+            return
+        self.degraded.append((message, reason))
+        self.degraded_ready.set()
+
+    async def work_degraded(self):
+        while True:
+            while not self.degraded:
+                self.degraded_ready.clear()
+                await self.degraded_ready.wait()
+            message, reason = self.degraded.popleft()
+            self.degraded_active = True
+            try:
+                await self.run_degraded(message, reason)
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Error auto-flagging message {message.id} (degraded): {e}")
+            finally:
+                self.degraded_active = False
+
+    async def work(self):
+        while True:
+            while not self.pending:
+                self.ready.clear()
+                await self.ready.wait()
+            message, queued = self.pending.popleft()
+            if time.monotonic() - queued > self.max_wait:
+                self.degrade(message, "stale")
+                continue
+            self.active += 1
+            try:
+                await self.run_full(message)
+                self.stats['completed'] += 1
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Error auto-flagging message {message.id}: {e}")
+            finally:
+                self.active -= 1
+
+    def shed_total(self):
+        return sum(n for name, n in self.stats.items() if name.startswith('degraded_'))
+
+    def snapshot(self):
+        return {"pending": len(self.pending), "degraded_pending": len(self.degraded), "shed": self.shed_total(),
+                **self.stats}
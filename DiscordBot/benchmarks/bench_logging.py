@@ -0,0 +1,164 @@
+# bench_logging.py
+'''
+Event loop lag under gateway-style logging, old setup against logs.setup_logging. A stream of fake gateway
+events is logged the way discord.py does it (every event's payload at DEBUG on discord.gateway, a few INFO
+lines, and our moderation events), while a sampler task measures how late the loop wakes it up.
+
+Setups compared:
+  - sync file:        what bot.py used to do, a FileHandler on the `discord` logger at DEBUG
+  - queue, all debug: setup_logging with every DEBUG record kept
+  - queue, sampled:   setup_logging with the default 1 in 100 DEBUG records kept
+
+Pass --disk-latency to add a stall to every write, like a busy or network disk. Page-cached local writes are
+fast enough that the difference mostly shows there.
+
+Run from the DiscordBot folder:  python benchmarks/bench_logging.py [--events 20000] [--disk-latency 0.002]
+'''
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from logs import TEXT_FORMAT, log_event, logger, setup_logging
+
+gateway_logger = logging.getLogger('discord.gateway')
+client_logger = logging.getLogger('discord.client')
+
+
+def gateway_payload(n):
+    # Roughly the size and shape of a MESSAGE_CREATE dispatch
+    return {
+        "t": "MESSAGE_CREATE", "s": n, "op": 0,
+        "d": {
+            "id": str(1_200_000_000_000_000_000 + n), "channel_id": "1001", "guild_id": "1000",
+            "author": {"id": str(n % 500), "username": f"user{n % 500}", "global_name": None, "avatar": "a" * 32},
+            "content": "just posting some regular chat in the group channel " * 3,
+            "attachments": [], "embeds": [], "mentions": [], "mention_roles": [], "pinned": False, "tts": False,
+            "timestamp": "2026-10-17T12:00:00.000000+00:00", "type": 0, "flags": 0,
+            "member": {"roles": ["1002", "1003"], "joined_at": "2026-01-01T00:00:00.000000+00:00", "nick": None},
+        },
+    }
+
+
+class SlowStream:
+    '''A file whose writes each stall for `delay` seconds.'''
+
+    def __init__(self, stream, delay):
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, text):
+        time.sleep(self.delay)
+        return self.stream.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def slow_down(handler, delay):
+    if not delay:
+        return
+    handler.stream = SlowStream(handler.stream, delay)
+    open_stream = handler._open
+    handler._open = lambda: SlowStream(open_stream(), delay)  # rotation reopens the file
+
+
+def sync_file(workdir, delay):
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    handler = logging.FileHandler(filename=os.path.join(workdir, 'discord.log'), encoding='utf-8', mode='w')
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    slow_down(handler, delay)
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return handler.close
+
+
+def queued(debug_sample):
+    def setup(workdir, delay):
+        listener = setup_logging(os.path.join(workdir, 'discord.log'), os.path.join(workdir, 'moderation.log'),
+                                 max_bytes=5_000_000, debug_sample=debug_sample, console=False)
+        for handler in listener.handlers:
+            slow_down(handler, delay)
+        return listener.stop
+    return setup
+
+
+SETUPS = [
+    ("sync file", sync_file),
+    ("queue, all debug", queued(1)),
+    ("queue, sampled", queued(100)),
+]
+
+
+async def sample_lag(interval, lags, stop):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+async def feed(events, rate, call_times):
+    for n in range(events):
+        start = time.perf_counter()
+        gateway_logger.debug('For Shard ID %s: WebSocket Event: %s', None, gateway_payload(n))
+        if n % 20 == 0:
+            client_logger.info('Dispatching event %s', 'message')
+        if n % 50 == 0:
+            log_event("flag", report_id=n, guild_id=1000, channel_id=1001, message_id=n, score=0.9)
+        call_times.append(time.perf_counter() - start)
+        # Gateway events arrive in bursts; yield between them like the websocket reader does
+        if rate:
+            await asyncio.sleep(1 / rate)
+        elif n % 10 == 0:
+            await asyncio.sleep(0)
+
+
+def pct(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000 if ordered else 0.0
+
+
+async def run(setup, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        stop_logging = setup(workdir, args.disk_latency)
+        lags, call_times = [], []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_lag(0.005, lags, stop))
+        start = time.perf_counter()
+        await feed(args.events, args.rate, call_times)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await sampler
+        drain_start = time.perf_counter()
+        stop_logging()
+        drain = time.perf_counter() - drain_start
+        written = sum(os.path.getsize(os.path.join(workdir, name)) for name in os.listdir(workdir))
+    return elapsed, lags, call_times, drain, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20000, help="gateway events to log")
+    parser.add_argument("--rate", type=float, default=0, help="events per second (0: as fast as possible)")
+    parser.add_argument("--disk-latency", type=float, default=0.0, help="seconds added to every log write")
+    args = parser.parse_args()
+
+    print(f"{'setup':<18}{'events/s':>10}{'lag p50':>10}{'lag p99':>10}{'lag max':>10}"
+          f"{'call p99':>10}{'drain':>9}{'written':>10}")
+    for name, setup in SETUPS:
+        elapsed, lags, call_times, drain, written = asyncio.run(run(setup, args))
+        print(f"{name:<18}{args.events / elapsed:>10.0f}{pct(lags, 0.5):>8.2f}ms{pct(lags, 0.99):>8.2f}ms"
+              f"{max(lags, default=0) * 1000:>8.2f}ms{pct(call_times, 0.99):>8.3f}ms{drain:>8.2f}s"
+              f"{written / 1_000_000:>8.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
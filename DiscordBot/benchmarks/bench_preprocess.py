@@ -0,0 +1,87 @@
+# bench_preprocess.py
+'''
+Compares the old is_AI_generated preprocessing (full decode, convert to RGB, re-encode as JPEG, base64) with
+preprocess.prepare_image on a few synthetic uploads. Reports payload bytes sent to the endpoint, how that
+changed from the old path, and CPU time per image.
+
+The old path saved at PIL's default quality (75), prepare_image at JPEG_QUALITY, so small images can come out
+bigger than before. The "re-encode" column is what prepare_image would send without its JPEG pass-through;
+a new payload bigger than that means a JPEG was passed through that shouldn't have been, and is marked "!".
+
+Run from the DiscordBot folder:  python benchmarks/bench_preprocess.py
+'''
+import base64
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+
+from preprocess import JPEG_QUALITY, MODEL_INPUT_SIZE, prepare_image
+
+ROUNDS = 5
+
+
+def legacy_encode(data):
+    image = Image.open(io.BytesIO(data)).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG")
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def reencode(data):
+    # prepare_image's resize path, for every format
+    image = Image.open(io.BytesIO(data))
+    image.draft("RGB", (MODEL_INPUT_SIZE, MODEL_INPUT_SIZE))
+    image.thumbnail((MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), Image.BILINEAR, reducing_gap=2.0)
+    image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=JPEG_QUALITY)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def make_image(size, fmt, **kwargs):
+    # Noise on top of a gradient so PNGs don't compress to nothing
+    image = Image.merge("RGB", [
+        Image.linear_gradient("L").resize(size),
+        Image.effect_noise(size, 60),
+        Image.radial_gradient("L").resize(size),
+    ])
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def measure(fn, data):
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        out = fn(data)
+    cpu = (time.process_time() - start) / ROUNDS
+    return len(out if isinstance(out, str) else out[0]), cpu
+
+
+def main():
+    samples = [
+        ("4000x3000 PNG", make_image((4000, 3000), "PNG")),
+        ("4000x3000 JPEG", make_image((4000, 3000), "JPEG", quality=92)),
+        ("2048x2048 TIFF", make_image((2048, 2048), "TIFF")),
+        ("400x300 JPEG q85", make_image((400, 300), "JPEG", quality=85)),
+        ("400x300 JPEG q95", make_image((400, 300), "JPEG", quality=95)),
+    ]
+
+    print(f"{'image':<18}{'upload':>12}{'old payload':>14}{'new payload':>14}{'change':>9}{'re-encode':>12}"
+          f"{'old cpu':>10}{'new cpu':>10}")
+    for name, data in samples:
+        old_bytes, old_cpu = measure(legacy_encode, data)
+        new_bytes, new_cpu = measure(prepare_image, data)
+        reencoded = len(reencode(data))
+        print(f"{name:<18}{len(data):>12,}{old_bytes:>14,}{new_bytes:>14,}{new_bytes / old_bytes - 1:>+9.0%}"
+              f"{reencoded:>11,}{'!' if new_bytes > reencoded else ' '}"
+              f"{old_cpu * 1000:>8.1f}ms{new_cpu * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+# bench_replay.py
+'''
+Offline load test for ModBot: no Discord connection and no Vertex endpoint. Messages are built as fake
+discord.py objects and fed through on_message (and from there handle_dm / handle_channel_message); channel
+sends, edits and fetches, attachment downloads and endpoint predictions are answered locally after a
+configurable delay.
+
+A stream is either synthetic (group channel chatter with text and images, users filing reports over DM,
+moderators working through `review next`) or replayed from a JSONL file, one event per line:
+
+    {"id": 1, "where": "group" | "dm" | "mod", "author": 42, "content": "...", "images": ["photo3", "emoji"]}
+
+`--record stream.jsonl` saves the synthetic stream so the same run can be replayed later. Messages from the same
+author are delivered in order; everyone else's run concurrently, as they would from the gateway.
+
+Reports throughput, per-stage latency (from the bot's own instrumentation), memory, and how many group messages
+got the full check. Admission control is opened wide unless --admission is given, so load shedding doesn't hide
+regressions in the classifier path.
+
+Run from the DiscordBot folder:  python benchmarks/bench_replay.py [--messages 5000] [--endpoint-latency 0.15]
+'''
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from types import SimpleNamespace
+
+BOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BOT_DIR)
+
+import discord
+from aiohttp import web
+from PIL import Image
+
+GUILD_ID = 1000
+GROUP_NUM = 1
+BOT_USER_ID = 1
+
+
+class FakeUser:
+    def __init__(self, user_id, name=None):
+        self.id = user_id
+        self.name = name or f"user{user_id}"
+        self.bot = user_id == BOT_USER_ID
+        self.mention = f"<@{user_id}>"
+
+
+class FakeAttachment:
+    def __init__(self, attachment_id, name, data, content_type, size, media_url):
+        self.id = attachment_id
+        self.filename = f"{name}.{content_type.split('/')[1]}"
+        self.content_type = content_type
+        self.size = len(data)
+        self.width, self.height = size
+        self.url = f"{media_url}/attachments/{name}"
+        self.proxy_url = f"{media_url}/proxy/{name}"
+
+
+class FakeMessage:
+    def __init__(self, message_id, content, author, channel, attachments=()):
+        self.id = message_id
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.attachments = list(attachments)
+        self.deleted = False
+
+    async def delete(self):
+        await self.channel.api_call("delete")
+        self.deleted = True
+
+
+class FakePartialMessage:
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.id = message_id
+
+    async def edit(self, embed=None, content=None):
+        await self.channel.api_call("edit")
+
+
+class FakeChannel:
+    '''A text channel (or DM when guild is None) whose REST calls each take api_latency seconds.'''
+
+    def __init__(self, channel_id, name, guild, api_latency, ids, counts):
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+        self.api_latency = api_latency
+        self.ids = ids
+        self.counts = counts
+        self.messages = {}
+
+    async def api_call(self, kind):
+        self.counts[kind] += 1
+        await asyncio.sleep(self.api_latency)
+
+    async def send(self, content=None, embed=None):
+        await self.api_call("send")
+        message = FakeMessage(next(self.ids), content or "", FakeUser(BOT_USER_ID, "Group 1 Bot"), self)
+        message.embed = embed
+        return message
+
+    async def fetch_message(self, message_id):
+        await self.api_call("fetch")
+        message = self.messages.get(message_id)
+        if message is None or message.deleted:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Message")
+        return message
+
+    def get_partial_message(self, message_id):
+        return FakePartialMessage(self, message_id)
+
+
+class FakeGuild:
+    def __init__(self, guild_id, name):
+        self.id = guild_id
+        self.name = name
+        self.channels = {}
+
+    @property
+    def text_channels(self):
+        return list(self.channels.values())
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+
+class StandInEndpoint:
+    '''Replaces aiplatform.Endpoint. predict() blocks (on the classifier's worker pool) like the real client does.'''
+
+    def __init__(self, latency, per_image):
+        self.latency = latency
+        self.per_image = per_image
+        self.calls = 0
+
+    def predict(self, instances):
+        self.calls += 1
+        time.sleep(self.latency + self.per_image * len(instances))
+        # Deterministic per image, so replays flag the same messages
+        scores = [zlib.crc32(instance["content"][:256].encode()) % 1000 / 1000 for instance in instances]
+        return SimpleNamespace(predictions=[{"confidences": [1 - p, p]} for p in scores])
+
+
+def make_images(count):
+    '''name -> (bytes, content type, (width, height)) for the attachments synthetic streams draw from.'''
+    rng = random.Random(7)
+    images = {}
+    for i in range(count):
+        size = rng.choice([(1024, 768), (800, 800), (1920, 1080), (480, 640)])
+        image = Image.merge("RGB", [Image.effect_noise(size, 40 + i)] * 3)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=85)
+        images[f"photo{i}"] = (buffer.getvalue(), "image/jpeg", size)
+    buffer = io.BytesIO()
+    Image.new("RGBA", (64, 64), (255, 200, 0, 255)).save(buffer, format="PNG")
+    images["emoji"] = (buffer.getvalue(), "image/png", (64, 64))
+    return images
+
+
+CHATTER = ["lol", "anyone up for a match tonight?", "gg", "that patch broke everything", "check this out",
+           "brb", "who's hosting?", "i think the new map is better", "nice screenshot", "see you all tomorrow"]
+FLAGGED = ["free nitro at dlscord-gift.ru claim your reward", "kys loser nobody likes you",
+           "i want to die, i'm going to end my life", "crypto giveaway guaranteed returns dm me to invest"]
+
+
+def synthetic_stream(count, images, seed=1):
+    '''Group chatter plus report flows over DM and review flows in the mod channel, as event dicts.'''
+    rng = random.Random(seed)
+    ids = itertools.count(1_200_000_000_000_000_000)
+    photos = [name for name in images if name.startswith("photo")]
+    group_ids = []
+    events = []
+    reporters = itertools.count(5000)
+    moderators = [900 + i for i in range(3)]
+    while len(events) < count:
+        roll = rng.random()
+        if roll < 0.85 or not group_ids:
+            event = {"id": next(ids), "where": "group", "author": rng.randrange(100, 400), "images": []}
+            kind = rng.random()
+            if kind < 0.08:
+                event["content"] = rng.choice(FLAGGED)
+            else:
+                event["content"] = rng.choice(CHATTER)
+                if kind < 0.20:
+                    event["images"] = [rng.choice(photos)]
+                elif kind < 0.25:
+                    event["images"] = ["emoji"]
+            group_ids.append(event["id"])
+            events.append(event)
+        elif roll < 0.95:
+            # A user files a report against a recent group message: report, link, category, subtype, q's
+            author = next(reporters)
+            target = rng.choice(group_ids[-50:])
+            category = str(rng.randrange(1, 7))
+            for content in ["report", f"https://discord.com/channels/{GUILD_ID}/{GUILD_ID + 1}/{target}",
+                            category, "1", "yes", rng.choice(["yes", "no"]), "no"]:
+                events.append({"id": next(ids), "where": "dm", "author": author, "content": content, "images": []})
+        else:
+            moderator = rng.choice(moderators)
+            for content in ["review next", "yes", "no", "no"]:
+                events.append({"id": next(ids), "where": "mod", "author": moderator, "content": content, "images": []})
+    return events
+
+
+async def serve_media(images, latency):
+    async def attachment(request):
+        await asyncio.sleep(latency)
+        data, content_type, _ = images[request.match_info["name"]]
+        return web.Response(body=data, content_type=content_type)
+
+    app = web.Application()
+    app.router.add_get("/attachments/{name}", attachment)
+    app.router.add_get("/proxy/{name}", attachment)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def run(args):
+    # Everything the bot writes (reports.db, verdicts.db, discord.log) goes in a scratch directory
+    workdir = tempfile.mkdtemp(prefix="modbot-replay-")
+    os.chdir(workdir)
+    import bot as bot_module
+    from instrumentation import metrics
+    bot_module.stats_port = None
+    if not args.admission:
+        # Every group message gets the full check, so the run exercises the classifier path; --admission keeps
+        # the bot's rate limits and queue bound
+        bot_module.admission_author_rate = bot_module.admission_channel_rate = (10 ** 9, 1)
+        bot_module.admission_max_pending = 10 ** 9
+        bot_module.admission_max_wait = float("inf")
+
+    images = make_images(args.images)
+    if args.replay:
+        with open(args.replay) as f:
+            events = [json.loads(line) for line in f if line.strip()]
+    else:
+        events = synthetic_stream(args.messages, images)
+    if args.record:
+        with open(args.record, "w") as f:
+            f.writelines(json.dumps(event) + "\n" for event in events)
+
+    media_runner, media_url = await serve_media(images, args.media_latency)
+    counts = {"send": 0, "edit": 0, "fetch": 0, "delete": 0}
+    ids = itertools.count(1_300_000_000_000_000_000)
+    guild = FakeGuild(GUILD_ID, "Replay Guild")
+    group = FakeChannel(GUILD_ID + 1, f"group-{GROUP_NUM}", guild, args.api_latency, ids, counts)
+    mod = FakeChannel(GUILD_ID + 2, f"group-{GROUP_NUM}-mod", guild, args.api_latency, ids, counts)
+    guild.channels = {group.id: group, mod.id: mod}
+    dms = {}
+
+    tracemalloc.start()
+    client = bot_module.ModBot()
+    client._connection.user = FakeUser(BOT_USER_ID, "Group 1 Bot")
+    client.get_guild = {GUILD_ID: guild}.get
+    client.group_num = str(GROUP_NUM)
+    client.router.configure(client.channel_names(), [guild])
+    endpoint = client.classifier.endpoint = StandInEndpoint(args.endpoint_latency, args.per_image_latency)
+    await client.setup_hook()
+
+    attachment_ids = itertools.count(1_400_000_000_000_000_000)
+    last_by_author = {}
+    errors = []
+
+    def build(event):
+        if event["where"] == "dm":
+            channel = dms.get(event["author"])
+            if channel is None:
+                channel = dms[event["author"]] = FakeChannel(next(ids), "dm", None, args.api_latency, ids, counts)
+        else:
+            channel = group if event["where"] == "group" else mod
+        attachments = [FakeAttachment(next(attachment_ids), name, images[name][0], images[name][1], images[name][2],
+                                      media_url) for name in event.get("images", [])]
+        message = FakeMessage(event["id"], event["content"], FakeUser(event["author"]), channel, attachments)
+        channel.messages[message.id] = message
+        return message
+
+    async def deliver(message, previous):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await client.on_message(message)
+        except Exception as e:
+            errors.append(repr(e))
+
+    start = time.perf_counter()
+    interval = 1 / args.rate if args.rate else 0
+    tasks = []
+    for n, event in enumerate(events):
+        message = build(event)
+        task = asyncio.create_task(deliver(message, last_by_author.get(event["author"])))
+        last_by_author[event["author"]] = task
+        tasks.append(task)
+        if interval:
+            await asyncio.sleep(max(0, start + (n + 1) * interval - time.perf_counter()))
+        elif n % 100 == 99:
+            await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+
+    # Handlers have returned; wait for the background work they started (scoring, replies, mod posts)
+    while (not client.admission.idle() or client.outbox.workers
+           or any(not queue.empty() for queue in client.mod_queue.queues.values())):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    filed = len(client.flagged.find(limit=len(events)))
+    await client.close()
+    await media_runner.cleanup()
+
+    print(f"events: {len(events)}  ({sum(e['where'] == 'group' for e in events)} group, "
+          f"{sum(e['where'] == 'dm' for e in events)} dm, {sum(e['where'] == 'mod' for e in events)} mod)")
+    print(f"elapsed: {elapsed:.2f}s  throughput: {len(events) / elapsed:,.0f} events/s  errors: {len(errors)}")
+    print(f"fake REST calls: {counts}  endpoint predict calls: {endpoint.calls}")
+    print(f"reports filed: {filed}  left in review queue: {sum(len(queue) for queue in client.queues.values())}")
+    admission = client.admission.stats
+    full_share = admission['completed'] / admission['received'] if admission['received'] else 0.0
+    print(f"full checks: {admission['completed']} of {admission['received']} group messages ({full_share:.0%})  "
+          f"admission control: {dict(admission)}")
+    print(f"memory: traced {current / 1e6:.1f} MB now, {peak / 1e6:.1f} MB peak; "
+          f"max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+    print(f"\n{'stage':<52}{'count':>8}{'p50':>10}{'p99':>10}{'max':>10}")
+    for (name, labels), histogram in sorted(metrics.histograms.items()):
+        label = name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else "")
+        print(f"{label[:51]:<52}{histogram.count:>8}{histogram.percentile(0.5) * 1000:>8.2f}ms"
+              f"{histogram.percentile(0.99) * 1000:>8.2f}ms{histogram.max * 1000:>8.2f}ms")
+    for error in sorted(set(errors))[:10]:
+        print(f"error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000, help="synthetic stream length")
+    parser.add_argument("--images", type=int, default=40, help="distinct photos in the synthetic stream")
+    parser.add_argument("--rate", type=float, default=0, help="events per second to feed (0: as fast as possible)")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="seconds per fake Discord REST call")
+    parser.add_argument("--media-latency", type=float, default=0.02, help="seconds per attachment download")
+    parser.add_argument("--endpoint-latency", type=float, default=0.15, help="seconds per stand-in predict call")
+    parser.add_argument("--per-image-latency", type=float, default=0.01, help="extra predict seconds per image")
+    parser.add_argument("--replay", help="JSONL stream to replay instead of a synthetic one")
+    parser.add_argument("--record", help="write the stream that was run to this JSONL file")
+    parser.add_argument("--admission", action="store_true",
+                        help="keep the bot's admission control limits (off by default, so nothing is shed)")
+    args = parser.parse_args()
+    if args.record:
+        args.record = os.path.abspath(args.record)
+    if args.replay:
+        args.replay = os.path.abspath(args.replay)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
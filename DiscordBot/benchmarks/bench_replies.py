@@ -0,0 +1,114 @@
+# bench_replies.py
+'''
+Walks a DM report through every step of Report.handle_message against a fake channel that takes REST_LATENCY
+seconds per send, and compares sending each reply line on its own (the old handle_dm loop) with the Outbox.
+
+  handler:   time until the handler is free to process the next event
+  delivered: time until the user has seen every line of the step
+
+Run from the DiscordBot folder:  python benchmarks/bench_replies.py
+'''
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from outbox import Outbox
+from report import Report
+from resolver import MessageResolver
+
+REST_LATENCY = 0.08
+STEPS = ["report", "https://discord.com/channels/1/2/3", "1", "2", "yes", "no", "no"]
+
+
+class FakeChannel:
+    id = 2
+
+    def __init__(self):
+        self.sent = []
+        self.guild = FakeGuild(self)
+
+    async def send(self, content):
+        await asyncio.sleep(REST_LATENCY)
+        self.sent.append(content)
+
+    async def fetch_message(self, message_id):
+        return FakeMessage("reported content", channel=self)
+
+
+class FakeGuild:
+    id = 1
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def get_channel(self, channel_id):
+        return self.channel
+
+
+class FakeAuthor:
+    id = 42
+    name = "reporter"
+
+
+class FakeMessage:
+    id = 3
+
+    def __init__(self, content, channel):
+        self.content = content
+        self.channel = channel
+        self.author = FakeAuthor()
+        self.guild = FakeGuild(channel)
+
+
+class FakeClient:
+    def __init__(self, channel):
+        self.guild = FakeGuild(channel)
+        self.messages = MessageResolver()
+
+    def get_guild(self, guild_id):
+        return self.guild
+
+    def serves_guild(self, guild_id):
+        return True
+
+    def resolve_channel(self, guild_id, channel_id):
+        return self.guild.get_channel(channel_id)
+
+
+async def run_flow(batched):
+    channel = FakeChannel()
+    outbox = Outbox()
+    report = Report(FakeClient(channel))
+    rows = []
+    for step in STEPS:
+        start = time.perf_counter()
+        before = len(channel.sent)
+        responses = await report.handle_message(FakeMessage(step, channel))
+        if batched:
+            outbox.send(channel, responses)
+        else:
+            for r in responses:
+                await channel.send(r)
+        handler = time.perf_counter() - start
+        await outbox.flush()
+        delivered = time.perf_counter() - start
+        rows.append((step, len(responses), len(channel.sent) - before, handler, delivered))
+    return rows
+
+
+def main():
+    old = asyncio.run(run_flow(batched=False))
+    new = asyncio.run(run_flow(batched=True))
+    print(f"REST latency {REST_LATENCY * 1000:.0f}ms per send")
+    print(f"{'step':<12}{'lines':>6}{'old sends':>10}{'new sends':>10}{'old handler':>13}{'new handler':>13}"
+          f"{'old delivered':>15}{'new delivered':>15}")
+    for (step, lines, old_sends, old_handler, old_done), (_, _, new_sends, new_handler, new_done) in zip(old, new):
+        print(f"{step[:11]:<12}{lines:>6}{old_sends:>10}{new_sends:>10}{old_handler * 1000:>11.1f}ms"
+              f"{new_handler * 1000:>11.1f}ms{old_done * 1000:>13.1f}ms{new_done * 1000:>13.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
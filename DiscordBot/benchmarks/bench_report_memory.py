@@ -0,0 +1,89 @@
+# bench_report_memory.py
+'''
+Memory held by 100k flagged reports in three shapes:
+  - legacy:  the old Report objects (per-instance __dict__ plus per-session category/subtype maps)
+  - dict:    plain dict records, as the flagged store first kept them
+  - slotted: ReportRecord, as loaded back from the store (slots + interned strings)
+
+Run from the DiscordBot folder:  python benchmarks/bench_report_memory.py
+'''
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from report import Report, ReportRecord
+
+COUNT = 100_000
+
+
+class LegacyReport:
+    # Attribute layout of Report before it was slotted
+    def __init__(self, fields):
+        self.state = "REPORT_COMPLETE"
+        self.client = None
+        self.message = None
+        self.reported_message = None
+        self.type_selected = fields["category"]
+        self.subtype_selected = fields["subtype"]
+        self.q1_response = fields["q1_response"]
+        self.q2_response = None
+        self.block_response = fields["block_response"]
+        self.author_id = fields["author_id"]
+        self.guild_id = fields["guild_id"]
+        self.message_content = fields["message_content"]
+        self.category_map = {str(i + 1): cat for i, cat in enumerate(Report.CATEGORIES)}
+        self.subtype_map = {str(i + 1): sub for i, sub in enumerate(Report.CATEGORIES[self.type_selected])}
+
+
+def make_fields(i):
+    category = random.choice(list(Report.CATEGORIES))
+    return {
+        "report_id": 1_200_000_000_000_000_000 + i,
+        "status": "open",
+        "created": 1_700_000_000.0 + i,
+        "author_id": random.getrandbits(60),
+        "guild_id": 1_100_000_000_000_000_000,
+        "channel_id": 1_100_000_000_000_000_001,
+        "message_id": random.getrandbits(60),
+        "message_author_id": random.getrandbits(60),
+        "message_author": f"user{i % 5000}",
+        "message_content": f"reported message number {i}",
+        "category": category,
+        "subtype": random.choice(Report.CATEGORIES[category]),
+        "q1_response": random.choice(["yes", "no"]),
+        "block_response": random.choice(["yes", "no"]),
+    }
+
+
+def measure(build, serialised):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [build(s) for s in serialised]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return used
+
+
+def main():
+    random.seed(152)
+    # Every shape is built from the JSON the store hands back, so string sharing is realistic
+    serialised = [json.dumps(make_fields(i)) for i in range(COUNT)]
+
+    results = [
+        ("legacy", measure(lambda s: LegacyReport(json.loads(s)), serialised)),
+        ("dict", measure(json.loads, serialised)),
+        ("slotted", measure(lambda s: ReportRecord.from_dict(json.loads(s)), serialised)),
+    ]
+    baseline = results[0][1]
+    print(f"{COUNT:,} reports")
+    for name, used in results:
+        print(f"{name:<10}{used / 1e6:>9.1f} MB{used / COUNT:>8.0f} B/report{used / baseline:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# bench_startup.py
+'''
+Where ModBot's cold start goes. Each run is a fresh interpreter (so nothing is already imported) that times, in
+order: importing discord, importing bot, constructing ModBot, running setup_hook, and then the classifier warm-up
+that now happens in the background after on_ready (PIL plus the Vertex SDK and endpoint client). The "eager"
+scenario first imports what bot.py used to load up front (openai, pdb, base64, google.cloud.aiplatform, PIL),
+for comparison; modules that aren't installed are listed and skipped.
+
+With --connect and a tokens.json in the DiscordBot folder, each run also logs in and waits for on_ready, split
+into the REST login and the gateway handshake, and the warm-up builds the real endpoint client. Otherwise
+nothing touches the network and the warm-up stage covers only the imports.
+
+Run from the DiscordBot folder:  python benchmarks/bench_startup.py [--runs 5] [--connect]
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+EAGER_IMPORTS = ["openai", "pdb", "base64", "google.cloud.aiplatform", "google.oauth2.service_account", "PIL.Image"]
+
+# Runs in the child interpreter; prints {stage: seconds} as JSON on its last line
+CHILD = r'''
+import asyncio, importlib, json, os, sys, time
+timings = {}
+start = time.perf_counter()
+
+def lap(stage):
+    global start
+    now = time.perf_counter()
+    timings[stage] = now - start
+    start = now
+
+eager, connect, token_dir = json.loads(sys.argv[1]), sys.argv[2] == "1", sys.argv[3]
+for name in eager:
+    importlib.import_module(name)
+if eager:
+    lap("eager imports")
+import discord
+lap("import discord")
+import bot
+lap("import bot")
+
+bot.stats_port = None
+bot.verdict_cache_path = None
+tokens = bot.load_tokens(os.path.join(token_dir, "tokens.json")) if connect else {}
+
+async def main():
+    global start
+    bot.classifier_warm_up = False  # timed on its own below
+    start = time.perf_counter()
+    client = bot.ModBot(tokens.get("google"))
+    lap("construct ModBot")
+    if connect:
+        await client.login(tokens["discord"])
+        lap("login (REST)")
+        gateway = asyncio.create_task(client.connect())  # setup_hook already ran inside login()
+        await client.wait_until_ready()
+        lap("gateway to on_ready")
+        await client.classifier.warm_up()
+    else:
+        await client.setup_hook()
+        lap("setup_hook")
+        # What warm_up() loads, minus building the endpoint client, which needs credentials and the network
+        from PIL import Image
+        Image.preinit()
+        try:
+            import google.cloud.aiplatform
+        except ImportError:
+            pass
+    lap("classifier warm-up (background)")
+    await client.close()
+
+asyncio.run(main())
+print(json.dumps(timings))
+'''
+
+
+def run_once(eager, connect):
+    with tempfile.TemporaryDirectory() as workdir:
+        result = subprocess.run(
+            [sys.executable, "-c", CHILD, json.dumps(eager), "1" if connect else "0", BOT_DIR],
+            cwd=workdir, env={**os.environ, "PYTHONPATH": os.pathsep.join([BOT_DIR, os.environ.get("PYTHONPATH", "")])},
+            capture_output=True, text=True,
+        )
+    if result.returncode != 0:
+        sys.exit(f"child run failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def installed(name):
+    result = subprocess.run([sys.executable, "-c", f"import {name}"], capture_output=True)
+    return result.returncode == 0
+
+
+def report(title, runs):
+    stages = list(runs[0])
+    print(f"\n{title}")
+    print(f"{'stage':<36}{'median':>10}{'min':>10}{'max':>10}")
+    for stage in stages:
+        samples = [run[stage] for run in runs]
+        print(f"{stage:<36}{statistics.median(samples) * 1000:>8.0f}ms{min(samples) * 1000:>8.0f}ms"
+              f"{max(samples) * 1000:>8.0f}ms")
+    ready = [sum(seconds for stage, seconds in run.items() if "warm-up" not in stage) for run in runs]
+    print(f"{'until ready to serve':<36}{statistics.median(ready) * 1000:>8.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per scenario")
+    parser.add_argument("--connect", action="store_true", help="also log in and wait for on_ready (needs tokens.json)")
+    args = parser.parse_args()
+
+    eager = [name for name in EAGER_IMPORTS if installed(name)]
+    missing = sorted(set(EAGER_IMPORTS) - set(eager))
+    if missing:
+        print(f"not installed, left out of the eager scenario: {', '.join(missing)}")
+
+    report("lazy (current)", [run_once([], args.connect) for _ in range(args.runs)])
+    report("eager (old bot.py imports first)", [run_once(eager, args.connect) for _ in range(args.runs)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# bench_triage.py
+'''
+Runs triage.screen_attachment and triage.inspect_image over a synthetic mix of group channel uploads (emoji,
+stickers, animated GIFs, generator output with and without provenance metadata, phone photos, screenshots).
+Each image is inspected as the bot sees it: the whole original if it is downloaded as is, or, when it is big
+enough to be fetched resized through the media proxy, the first METADATA_PREFIX_BYTES of the original (PNG and
+JPEG) or the proxy's re-encoded copy (WebP, whose metadata comes after the image data). The "proxy" column is
+what inspecting the proxy's copy would decide for every format (what the bot used to do).
+Reports, per kind of upload and overall, the fraction of remote classifier calls avoided and the local latency
+added per image.
+
+Run from the DiscordBot folder:  python benchmarks/bench_triage.py
+'''
+import io
+import os
+import struct
+import sys
+import time
+import zlib
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image, PngImagePlugin
+
+from preprocess import resized_proxy_url
+from triage import FORWARD, METADATA_PREFIX_BYTES, METADATA_PREFIX_TYPES, inspect_image, screen_attachment
+
+ROUNDS = 2000
+
+
+def noise(size):
+    return Image.merge("RGB", [Image.effect_noise(size, 60)] * 3)
+
+
+def encode(image, fmt, **kwargs):
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def with_app_segment(jpeg, marker, payload):
+    # Splices an APPn segment in right after SOI
+    return jpeg[:2] + struct.pack(">BBH", 0xFF, marker, len(payload) + 2) + payload + jpeg[2:]
+
+
+def png_chunk(chunk_type, body):
+    return struct.pack(">I", len(body)) + chunk_type + body + struct.pack(">I", zlib.crc32(chunk_type + body))
+
+
+def samples():
+    photo = encode(noise((1024, 768)), "JPEG", quality=85)
+    sd_info = PngImagePlugin.PngInfo()
+    sd_info.add_text("parameters", "a cat in a spacesuit\nSteps: 30, Sampler: DPM++ 2M, CFG scale: 7")
+    frames = [noise((320, 240)) for _ in range(4)]
+    png = encode(noise((512, 512)), "PNG")
+    apng = png[:33] + png_chunk(b"acTL", struct.pack(">II", 4, 0)) + png[33:]
+    xmp = (b"http://ns.adobe.com/xap/1.0/\0<x:xmpmeta><rdf:Description Iptc4xmpExt:DigitalSourceType="
+           b"\"http://cv.iptc.org/newscodes/digitalsourcetype/trainedAlgorithmicMedia\"/></x:xmpmeta>")
+    webp_xmp = (b"<x:xmpmeta><rdf:Description Iptc4xmpExt:DigitalSourceType="
+                b"\"http://cv.iptc.org/newscodes/digitalsourcetype/trainedAlgorithmicMedia\"/></x:xmpmeta>")
+    c2pa = b"JP\0\x01\0\0\0\x01jumbc2pa claim_generator=\"OpenAI DALL-E\""
+
+    # (kind, share of uploads, content type, width, height, bytes)
+    return [
+        ("emoji", 20, "image/png", 64, 64, encode(noise((64, 64)), "PNG")),
+        ("sticker", 10, "image/png", 160, 160, encode(noise((160, 160)), "PNG")),
+        ("animated gif", 10, "image/gif", 320, 240,
+         encode(frames[0], "GIF", save_all=True, append_images=frames[1:], loop=0)),
+        ("animated png", 3, "image/png", 512, 512, apng),
+        ("banner", 2, "image/jpeg", 1500, 100, encode(noise((1500, 100)), "JPEG")),
+        ("sd png", 2, "image/png", 512, 512, encode(noise((512, 512)), "PNG", pnginfo=sd_info)),
+        ("sdxl png", 3, "image/png", 1024, 1024, encode(noise((1024, 1024)), "PNG", pnginfo=sd_info)),
+        ("xmp ai jpeg", 3, "image/jpeg", 1024, 768, with_app_segment(photo, 0xE1, xmp)),
+        ("c2pa jpeg", 2, "image/jpeg", 1024, 768, with_app_segment(photo, 0xEB, c2pa)),
+        ("xmp ai webp", 1, "image/webp", 1024, 768, encode(noise((1024, 768)), "WEBP", xmp=webp_xmp)),
+        ("photo", 29, "image/jpeg", 1024, 768, photo),
+        ("screenshot", 15, "image/png", 512, 512, png),
+    ]
+
+
+def proxy_copy(data):
+    # The media proxy's resized variant: downscaled to fit the model input and re-encoded without metadata
+    image = Image.open(io.BytesIO(data))
+    fmt = image.format
+    image.thumbnail((512, 512))
+    return encode(image.convert("RGB"), fmt)
+
+
+def triage(attachment, data):
+    if screen_attachment(attachment):
+        return "skip"
+    action, _ = inspect_image(data)
+    return action
+
+
+def main():
+    kinds = samples()
+    total_share = sum(share for _, share, _, _, _, _ in kinds)
+    avoided_share = 0.0
+    proxy_avoided_share = 0.0
+    weighted_us = 0.0
+
+    print(f"{'upload':<14}{'share':>7}{'bytes':>10}{'inspected':>11}{'verdict':>10}{'proxy':>10}{'mean':>10}{'p99':>10}")
+    for kind, share, content_type, width, height, data in kinds:
+        attachment = SimpleNamespace(size=len(data), width=width, height=height, content_type=content_type,
+                                     proxy_url="https://media.discordapp.net/attachments/1/2/image")
+        proxied = resized_proxy_url(attachment) is not None
+        if not proxied:
+            inspected, seen = "original", data
+        elif content_type in METADATA_PREFIX_TYPES:
+            inspected, seen = "prefix", data[:METADATA_PREFIX_BYTES]
+        else:
+            inspected, seen = "proxy", proxy_copy(data)
+        timings = []
+        for _ in range(ROUNDS):
+            start = time.perf_counter_ns()
+            verdict = triage(attachment, seen)
+            timings.append(time.perf_counter_ns() - start)
+        timings.sort()
+        mean_us = sum(timings) / len(timings) / 1000
+        p99_us = timings[int(len(timings) * 0.99)] / 1000
+        proxy_verdict = triage(attachment, proxy_copy(data)) if proxied else verdict
+        if verdict != FORWARD:
+            avoided_share += share
+        if proxy_verdict != FORWARD:
+            proxy_avoided_share += share
+        weighted_us += mean_us * share
+        print(f"{kind:<14}{share / total_share:>7.0%}{len(data):>10,}{inspected:>11}"
+              f"{verdict:>10}{proxy_verdict:>10}{mean_us:>8.1f}us{p99_us:>8.1f}us")
+
+    print(f"\nremote calls avoided: {avoided_share / total_share:.0%} of image uploads "
+          f"({proxy_avoided_share / total_share:.0%} if the proxy's copies were inspected instead)")
+    print(f"added local latency: {weighted_us / total_share:.1f}us per image on average")
+
+
+if __name__ == "__main__":
+    main()
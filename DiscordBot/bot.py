@@ -4,59 +4,266 @@ import os
 import json
 import logging
 import re
-import requests
+import asyncio
 import random
+import time
 from review import Review, ReviewState 
 from report import Report, State 
-from openai import OpenAI
-import pdb
-import base64
-from google.cloud import aiplatform
-from google.oauth2 import service_account
-from PIL import Image
-import io
-
-# Set up logging to the console
+from classifier import ImageClassifier
+from cache import VerdictCache
+from preprocess import resized_proxy_url
+from triage import FILENAME_SCORE, generator_filename, screen_attachment
+from textscore import TextScorer
+from instrumentation import metrics
+from stats import ScanStats, StatsServer, render_json, summary_embed
+from storage import ReportStore, SnowflakeGenerator
+from modqueue import ModQueueWriter
+from outbox import Outbox
+from resolver import MessageResolver
+from priority import ModerationQueue, priority_for, tier_for
+from sessions import SessionManager
+from routing import MOD, MONITORED, ChannelRouter
+from logs import log_event, setup_logging
+from admission import AdmissionController
+
+# Handlers are set up by start_logging, which runs when the bot does (not when this module is imported)
 logger = logging.getLogger('discord')
-logger.setLevel(logging.DEBUG)
-handler = logging.FileHandler(filename='discord.log', encoding='utf-8', mode='w')
-handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
-logger.addHandler(handler)
+
+region = "us-central1"  # Or your endpoint's region
+endpoint_id = "3609790132476968960"  # Your endpoint ID
+classifier_concurrency = 4  # Max number of images being downloaded/scored at the same time
+classifier_timeout = 15  # Seconds before we give up on scoring a single image
+classifier_batch_size = 8  # Max images sent to the endpoint in one predict call
+classifier_batch_wait = 0.01  # Seconds to wait for more images before sending a partial batch
+classifier_max_download = 10_000_000  # Bytes; bigger attachments are skipped instead of downloaded
+classifier_warm_up = True  # Load the classifier stack in the background after connecting instead of on first use
+ai_threshold = 0.5  # Images scored above this AI-generated confidence get auto-flagged
+text_threshold = 0.6  # Messages the text scorer rates above this get auto-flagged
+monitored_channel_names = ()  # Channels scanned for auto-flagging in addition to group-#, by name
+text_model_path = None  # Optional linear text model (JSON, see textscore.py) scored alongside the keyword lexicon
+admission_workers = 8  # Group channel messages getting the full check (text and images) at the same time
+admission_max_pending = 200  # Messages waiting for a full check before load shedding starts
+admission_policy = "drop-oldest"  # What to shed when that queue is full: "drop-oldest" or "sample", see admission.py
+admission_author_rate = (5, 10)  # (messages, per seconds) fully checked per author once the queue is full
+admission_channel_rate = (60, 10)  # (messages, per seconds) fully checked per channel once the queue is full
+admission_max_wait = 30  # Seconds a message can wait for a full check before it gets the cheap one instead
+admission_max_degraded = 1000  # Messages waiting for the cheap check; past this they aren't checked at all
+stats_interval = 15 * 60  # Seconds between scanner summary embeds in each mod channel
+stats_port = 9108  # Local port serving /stats (JSON) and /metrics (Prometheus), set to None to disable
+instrumentation_enabled = True  # Per-stage latency histograms and API call counters, see instrumentation.py
+reports_db_path = 'reports.db'  # Flagged reports are kept here so they can still be reviewed after a restart
+session_idle_timeout = 15 * 60  # Seconds before an abandoned report/review flow is dropped
+review_claim_ttl = 2 * session_idle_timeout  # Shared store: seconds before a review claim left by a dead process lapses
+max_sessions = 10000  # Max in-progress reports (and, separately, reviews) kept in memory
+verdict_cache_size = 10000  # Number of image verdicts remembered
+verdict_cache_ttl = 24 * 60 * 60  # Seconds before a cached verdict is re-checked
+verdict_cache_path = 'verdicts.db'  # Keeps verdicts across restarts, set to None for memory only
+verdict_cache_perceptual = True  # Also match resized/re-encoded copies of a known image
+log_path = 'discord.log'  # Bot and discord.py log, written by a background thread
+moderation_log_path = 'moderation.log'  # Flags, reports and review outcomes as JSON lines
+log_max_bytes = 20_000_000  # Size at which a log is rotated
+log_rotate_when = None  # Rotate on a schedule instead of by size, e.g. 'midnight'
+log_backups = 5  # Rotated logs kept
+log_debug_sample = 100  # Keep 1 in this many DEBUG records (discord.py logs every gateway event at DEBUG); 1 keeps all
 
 # There should be a file called 'tokens.json' inside the same folder as this file
 token_path = 'tokens.json'
-if not os.path.isfile(token_path):
-    raise Exception(f"{token_path} not found!")
-with open(token_path) as f:
-    # If you get an error here, it means your token is formatted incorrectly. Did you put it in quotes?
-    tokens = json.load(f)
-    discord_token = tokens['discord']
-    google_credentials = tokens['google']
-    project_id = google_credentials['project_id']
-    region = "us-central1"  # Or your endpoint's region
-    endpoint_id = "3609790132476968960"  # Your endpoint ID
-    google_credentials_dict = tokens.get('google')
-    
-    if not google_credentials_dict:
-        raise ValueError(f"No 'google' credentials found in 'tokens.json")
-    
 
 
+def start_logging(tag=None):
+    '''Starts the background log writer. tag (e.g. a shard process index) gives the process its own log files.'''
+    def tagged(path):
+        root, ext = os.path.splitext(path)
+        return f"{root}.{tag}{ext}" if tag is not None and path else path
+    return setup_logging(tagged(log_path), tagged(moderation_log_path), max_bytes=log_max_bytes,
+                         backups=log_backups, when=log_rotate_when, debug_sample=log_debug_sample)
+
+
+def load_tokens(path=token_path):
+    if not os.path.isfile(path):
+        raise Exception(f"{path} not found!")
+    with open(path) as f:
+        # If you get an error here, it means your token is formatted incorrectly. Did you put it in quotes?
+        tokens = json.load(f)
+    if not tokens.get('google'):
+        raise ValueError(f"No 'google' credentials found in '{path}'")
+    return tokens
+
 
 class ModBot(discord.Client):
-    def __init__(self): 
+    # Check for all common image formats
+    IMAGE_TYPES = {
+        "image/png",
+        "image/jpeg",
+        "image/jpg",
+        "image/gif",
+        "image/webp",
+        "image/tiff",
+        "image/bmp"
+    }
+
+    def __init__(self, google_credentials=None, worker_id=0, shared_store=False, endpoint=None, scorer=None,
+                 **options):
+        '''
+        google_credentials is the service account info from tokens.json, turned into credentials when the
+        classifier first needs them. Without it the classifier falls back to the environment's default credentials
+        (or, in benchmarks, a stand-in endpoint).
+
+        The rest is for running several bot processes side by side (see shards.py): worker_id keeps their report
+        IDs apart and offsets the stats port, shared_store makes the report database safe to share, endpoint
+        replaces the Vertex endpoint, scorer hands downloaded images to classifier worker processes (see
+        ImageClassifier), and options (e.g. shard_ids) are passed on to discord.py.
+        '''
         intents = discord.Intents.default()
         intents.message_content = True
-        super().__init__(command_prefix='.', intents=intents)
+        super().__init__(command_prefix='.', intents=intents, **options)
         self.group_num = None
 
         # self.strikes = {} will implement this in later Milestone 3 probably
-        self.flagged = {}
-        self.reviews = {}
-        self.mod_channels = {} # Map from guild to the mod channel id for that guild
-        self.reports = {} # Map from user IDs to the state of their report
+        self.shared_store = shared_store
+        self.flagged = ReportStore(reports_db_path, shared=shared_store) # Map from report IDs to stored report records
+        self.report_ids = SnowflakeGenerator(worker_id)
+        self.mod_queue = ModQueueWriter(self.flagged) # Posts report embeds to the mod channels in the background
+        self.outbox = Outbox() # Batches report/review flow replies into as few messages as possible
+        self.messages = MessageResolver() # Cache of reported messages, shared by every report and review
+        self.reviews = SessionManager("review", session_idle_timeout, max_sessions,
+                                      on_drop=self.review_dropped) # Map from moderator IDs to their review
+        self.queues = {} # Map from guild to its open reports, ranked for `review next`
+        self.queue_seq = 0 # Shared store: the last store change the queues have caught up with
+        self.router = ChannelRouter(on_mod_channel=self.mod_channel_changed) # Map from channel IDs to how we handle their messages
+        self.mod_channels = self.router.mod_channels # Map from guild to its mod channel, kept current by the router
+        self.reports = SessionManager("report", session_idle_timeout, max_sessions) # Map from user IDs to the state of their report
+
+        self.verdicts = VerdictCache(max_entries=verdict_cache_size, ttl=verdict_cache_ttl,
+                                     path=verdict_cache_path, perceptual=verdict_cache_perceptual)
+        self.classifier = ImageClassifier(google_credentials, (google_credentials or {}).get('project_id'), region, endpoint_id,
+                                          max_concurrency=classifier_concurrency, timeout=classifier_timeout,
+                                          max_batch_size=classifier_batch_size, max_batch_wait=classifier_batch_wait,
+                                          cache=self.verdicts, max_download_bytes=classifier_max_download,
+                                          endpoint=endpoint, scorer=scorer)
+        self.warm_up_task = None
+        self.text_scorer = TextScorer(model_path=text_model_path)
+        # Every group channel message goes through here, so a raid can't queue up unbounded classifier work
+        self.admission = AdmissionController(self.auto_flag, self.auto_flag_degraded, workers=admission_workers,
+                                             max_pending=admission_max_pending, policy=admission_policy,
+                                             author_rate=admission_author_rate, channel_rate=admission_channel_rate,
+                                             max_wait=admission_max_wait, max_degraded=admission_max_degraded,
+                                             on_unchecked=self.shed_unchecked)
+        self.scan_stats = ScanStats(self.verdicts, window=stats_interval) # Rolling scanner counts for the summary embed
+        self.stats_task = None
+        self.stats_server = StatsServer(port=stats_port + worker_id) if stats_port else None
+        if self.stats_server:
+            self.stats_server.route("/stats", "application/json", self.render_stats)
+            self.stats_server.route("/metrics", "text/plain; version=0.0.4", metrics.prometheus)
+        metrics.enabled = instrumentation_enabled
+        metrics.add_source("classifier", lambda: self.classifier.stats)
+        metrics.add_source("verdict_cache", lambda: self.verdicts.stats)
+        metrics.add_source("scanner", lambda: self.scan_stats.totals)
+        metrics.add_source("admission", lambda: self.admission.stats)
+
+    async def setup_hook(self):
+        # Reports still open from a previous run (or, when shared, filed by other processes) go in the review queue
+        if self.shared_store:
+            await self.sync_queues()
+        else:
+            for record in self.flagged.find(status="open", limit=100_000):
+                self.queue_for(record.guild_id).push(record)
+        self.flagged.start()
+        self.reports.start()
+        self.reviews.start()
+        self.admission.start()
+        self.stats_task = asyncio.create_task(self.publish_stats())
+        metrics.instrument_http(self.http)
+        metrics.start_lag_sampler()
+        if self.stats_server:
+            await self.stats_server.start()
+
+    async def close(self):
+        metrics.stop_lag_sampler()
+        if self.stats_task is not None:
+            self.stats_task.cancel()
+        if self.stats_server:
+            await self.stats_server.close()
+        self.reports.stop()
+        self.reviews.stop()
+        self.admission.stop()
+        await self.mod_queue.close()
+        await self.outbox.flush()
+        await self.classifier.close()
+        await self.flagged.close()
+        await super().close()
+
+    async def publish_stats(self):
+        # One summary embed per mod channel per interval, instead of a message per scanned message
+        while True:
+            await asyncio.sleep(stats_interval)
+            for guild_id, channel in list(self.mod_channels.items()):
+                snapshot = self.scan_stats.snapshot(guild_id)
+                if not snapshot['scanned'] and not snapshot['unchecked']:
+                    continue
+                try:
+                    await channel.send(embed=summary_embed(snapshot))
+                except discord.HTTPException as e:
+                    logger.error(f"Error posting scanner summary to mod channel: {e}")
+
+    def render_stats(self):
+        return render_json({
+            "window": self.scan_stats.snapshot(),
+            "totals": self.scan_stats.totals,
+            "classifier": self.classifier.stats,
+            "verdict_cache": self.verdicts.stats,
+            "admission": self.admission.snapshot(),
+            "review_queue": {guild_id: queue.pending_by_tier() for guild_id, queue in self.queues.items()},
+            "sessions": {"reports": len(self.reports), "reviews": len(self.reviews)},
+        })
+
+    def serves_guild(self, guild_id):
+        # Guilds served by another shard process aren't in our cache, but they did register a mod channel
+        return self.get_guild(guild_id) is not None or (self.shared_store and self.flagged.get_mod_channel(guild_id) is not None)
+
+    def resolve_channel(self, guild_id, channel_id):
+        '''
+        The channel with this ID, or None if we don't serve the guild or it has no such channel. For guilds another
+        shard process serves this is a PartialMessageable: not cached here, but enough to fetch messages over REST.
+        '''
+        guild = self.get_guild(guild_id)
+        if guild:
+            return guild.get_channel(channel_id)
+        if self.serves_guild(guild_id):
+            return self.get_partial_messageable(channel_id, guild_id=guild_id)
+        return None
+
+    def mod_channel_for(self, guild_id):
+        channel = self.mod_channels.get(guild_id)
+        if channel is None and self.shared_store:
+            channel_id = self.flagged.get_mod_channel(guild_id)
+            if channel_id:
+                channel = self.get_partial_messageable(channel_id, guild_id=guild_id)
+        return channel
+
+    async def fetch_reported_message(self, guild_id, channel_id, message_id):
+        '''
+        Looks a message up by its IDs, since reports and reviews only keep IDs around. Returns None if the
+        guild, channel or message no longer exists.
+        '''
+        channel = self.resolve_channel(guild_id, channel_id) if guild_id and channel_id else None
+        if not channel or not message_id:
+            return None
+        try:
+            return await self.messages.fetch(channel, message_id)
+        except (discord.errors.NotFound, discord.errors.Forbidden):
+            return None
 
-        self.credentials = service_account.Credentials.from_service_account_info(google_credentials_dict)
+    # Raw events fire whether or not discord.py had the message cached, unlike on_message_edit/on_message_delete
+    async def on_raw_message_edit(self, payload):
+        self.messages.invalidate(payload.guild_id, payload.channel_id, payload.message_id)
+
+    async def on_raw_message_delete(self, payload):
+        self.messages.invalidate(payload.guild_id, payload.channel_id, payload.message_id)
+
+    async def on_raw_bulk_message_delete(self, payload):
+        for message_id in payload.message_ids:
+            self.messages.invalidate(payload.guild_id, payload.channel_id, message_id)
 
     async def on_ready(self):
         print(f'{self.user.name} has connected to Discord! It is these guilds:')
@@ -71,13 +278,48 @@ class ModBot(discord.Client):
         else:
             raise Exception("Group number not found in bot's name. Name format should be \"Group # Bot\".")
 
-        # Find the mod channel in each guild that this bot should report to
-        for guild in self.guilds:
-            for channel in guild.text_channels:
-                if channel.name == f'group-{self.group_num}-mod':
-                    self.mod_channels[guild.id] = channel
-        
+        # Index the channels we monitor and the mod channel in each guild that this bot should report to
+        self.router.configure(self.channel_names(), self.guilds)
+
+        # The classifier stack loads lazily; get it ready now rather than on the first image someone posts
+        if classifier_warm_up and self.warm_up_task is None:
+            self.warm_up_task = asyncio.create_task(self.classifier.warm_up())
+
+    def channel_names(self):
+        group_name = f'group-{self.group_num}'
+        names = {name: MONITORED for name in monitored_channel_names}
+        names[group_name] = MONITORED
+        names[f'{group_name}-mod'] = MOD
+        return names
+
+    def mod_channel_changed(self, guild_id, channel):
+        # Other shard processes find the mod channel through the store
+        self.flagged.set_mod_channel(guild_id, channel.id if channel else None)
+
+    # Keep the channel routes current as guilds and channels come and go or get renamed
+    async def on_guild_join(self, guild):
+        self.router.add_guild(guild)
+
+    async def on_guild_available(self, guild):
+        self.router.add_guild(guild)
+
+    async def on_guild_remove(self, guild):
+        self.router.remove_guild(guild.id)
 
+    async def on_guild_channel_create(self, channel):
+        if isinstance(channel, discord.TextChannel):
+            self.router.update(channel)
+
+    async def on_guild_channel_update(self, before, after):
+        if isinstance(after, discord.TextChannel):
+            self.router.update(after)
+        else:
+            self.router.remove(after)
+
+    async def on_guild_channel_delete(self, channel):
+        self.router.remove(channel)
+
+    @metrics.timed("on_message")
     async def on_message(self, message):
         '''
         This function is called whenever a message is sent in a channel that the bot can see (including DMs). 
@@ -93,39 +335,167 @@ class ModBot(discord.Client):
         else:
             await self.handle_dm(message)
 
-    # Helper function for sending reports as embed links to the mod channel. 
-    async def send_report_embed(self, report):
-        msg    = report.message
-        mod_ch = self.mod_channels.get(report.guild_id)
-        jump_url = None
-        guild_id   = msg.guild.id
-        channel_id = msg.channel.id
-        message_id = msg.id
-        jump_url = f"https://discord.com/channels/{guild_id}/{channel_id}/{message_id}"
+    def report_embed(self, record):
+        '''
+        Builds the mod channel embed for a stored report or auto-flag, including how many reports have been
+        folded into it.
+        '''
+        jump_url = f"https://discord.com/channels/{record.guild_id}/{record.channel_id}/{record.message_id}"
+        if record.category == "automated":
+            embed = discord.Embed(
+                title="Auto-Flagged Message",
+                description=f"Suspect score: {record.score:.2%}",
+                color=discord.Color.orange()
+            )
+            if record.subtype in Report.SUBTYPE_CATEGORY:
+                # flagged by the text scorer rather than the image classifier
+                embed.add_field(name="Detected", value=f"{Report.SUBTYPE_CATEGORY[record.subtype]} → {record.subtype}",
+                                inline=False)
+            embed.add_field(name="Author",  value=f"<@{record.message_author_id}>", inline=True)
+            embed.add_field(name="Channel", value=f"<#{record.channel_id}>",      inline=True)
+            embed.add_field(name="Content", value=(record.message_content or "N/A")[:1024],      inline=False)
+            if record.attachment_scores and len(record.attachment_scores) > 1:
+                lines = [f"{name}: {conf:.2%}" if conf is not None else f"{name}: not scored"
+                         for name, conf in record.attachment_scores]
+                embed.add_field(name="Attachment Scores", value="\n".join(lines)[:1024], inline=False)
+            embed.add_field(
+                name="Jump to Message",
+                value=f"[Click here to view original message]({jump_url})",
+                inline=False
+            )
+            embed.add_field(
+                    name="Message Link",
+                    # inline code span prevents auto-linking
+                    value=f"`{jump_url}`",
+                    inline=True
+                )
+        else:
+            embed = discord.Embed(
+                title="🚨 New Report Submitted",
+                description=f"User <@{record.author_id}> completed a report.",
+                color=discord.Color.red()
+            )
+            embed.add_field(name="Flagged Message",value=f"{record.message_author}: {record.message_content}"[:1024],inline=False)
+            # add the jump link
+            embed.add_field(
+                name="Jump to Message",
+                value=f"[Click here to view original message]({jump_url})",
+                inline=False
+            )
+            embed.add_field(name="Category",     value=record.category or "N/A", inline=True)
+            embed.add_field(name="Subtype",      value=record.subtype or "N/A", inline=True)
+            embed.add_field(name="AI Suspected?", value=record.q1_response or "N/A", inline=True)
+            embed.add_field(name="User Blocked?",  value=record.block_response or "N/A", inline=True)
+            if record.score is not None:
+                embed.add_field(name="Suspect Score", value=f"{record.score:.2%}", inline=True)
+
+        if (record.reporter_count or 1) > 1:
+            histogram = sorted(record.categories.items(), key=lambda kv: -kv[1])
+            embed.add_field(name="Reports", value=str(record.reporter_count), inline=True)
+            embed.add_field(name="Categories", value=", ".join(f"{cat} ×{n}" for cat, n in histogram)[:1024], inline=True)
+        embed.set_footer(text=f"Report ID: {record.report_id}")
+        return embed
+
+    def report_summary(self, record):
+        # One-line version of report_embed, used when the report is merged into a digest
+        jump_url = f"https://discord.com/channels/{record.guild_id}/{record.channel_id}/{record.message_id}"
+        count = f" ({record.reporter_count} reports)" if (record.reporter_count or 1) > 1 else ""
+        return (f"{record.category} → {record.subtype}{count}: "
+                f"{record.message_author}: {(record.message_content or '')[:200]}\n[Jump to message]({jump_url})")
+
+    @metrics.timed("send_report_embed")
+    async def send_report_embed(self, report, score=None, attachment_scores=None):
+        '''
+        Files a completed user report or auto-flag and queues its embed for the mod channel. If the reported
+        message already has an open report, the new one is folded into it (reporter count and category
+        histogram) and the existing mod post is updated instead of a new one being posted.
+        '''
+        mod_ch = self.mod_channel_for(report.guild_id)
         if not mod_ch:
             return
-        embed = discord.Embed(
-            title="🚨 New Report Submitted",
-            description=f"User <@{report.author_id}> completed a report.",
-            color=discord.Color.red()
-        )
-        embed.add_field(name="Flagged Message",value=f"{msg.author.name}: {msg.content}",inline=False)
-        # add the jump link
-        embed.add_field(
-            name="Jump to Message",
-            value=f"[Click here to view original message]({jump_url})",
-            inline=False
-        )
-        embed.add_field(name="Category",     value=report.type_selected or "N/A", inline=True)
-        embed.add_field(name="Subtype",      value=report.subtype_selected or "N/A", inline=True)
-        if msg:
-            embed.add_field(name="Flagged Message", value=f"{msg.author.name}: {msg.content}", inline=False)
-        embed.add_field(name="AI Suspected?", value=report.q1_response or "N/A", inline=True)
-        embed.add_field(name="User Blocked?",  value=report.block_response or "N/A", inline=True)
-        mod_msg = await mod_ch.send(embed=embed)
-        embed.set_footer(text=f"Report ID: {mod_msg.id}")
-        await mod_msg.edit(embed=embed)
-        self.flagged[mod_msg.id] = report
+        record = report.to_record()
+        record.score = score
+        record.attachment_scores = attachment_scores
+
+        existing = self.flagged.get_open_for_message(record.message_id)
+        if existing is not None:
+            folded = existing.fold(record)
+            self.log_filed(record, existing.report_id, folded=folded, reporter_count=existing.reporter_count)
+            if folded:
+                self.flagged.put(existing.report_id, existing)
+                self.queue_for(existing.guild_id).push(existing)
+                embed = self.report_embed(existing)
+                if not self.mod_queue.refresh(existing.report_id, embed, self.report_summary(existing)):
+                    # Posted before a restart: we no longer know its mod post, so put up a fresh one
+                    self.mod_queue.submit(mod_ch, existing.report_id, embed,
+                                          digestible=tier_for(existing) == "low",
+                                          summary=self.report_summary(existing), priority=priority_for(existing))
+            return
+
+        # The ID is ours rather than the mod message's, so the embed goes out complete in a single send
+        report_id = self.report_ids.next_id()
+        self.flagged.add(report_id, record)
+        self.log_filed(record, report_id)
+        self.queue_for(record.guild_id).push(record)
+        self.mod_queue.submit(mod_ch, report_id, self.report_embed(record), digestible=tier_for(record) == "low",
+                              summary=self.report_summary(record), priority=priority_for(record))
+
+    def log_filed(self, record, report_id, **fields):
+        log_event("flag" if record.category == "automated" else "report", report_id=report_id,
+                  guild_id=record.guild_id, channel_id=record.channel_id, message_id=record.message_id,
+                  message_author_id=record.message_author_id,
+                  reporter_id=record.author_id if record.category != "automated" else None,
+                  category=record.category, subtype=record.subtype, score=record.score, tier=tier_for(record),
+                  **fields)
+
+    def review_dropped(self, moderator_id, review):
+        # An abandoned review shouldn't keep its report out of `review next`
+        record = self.flagged.get(review.report.report_id)
+        if record is not None and record.status == "open":
+            self.queue_for(record.guild_id).release(record)
+            if self.shared_store:
+                self.flagged.release(record.report_id, moderator_id)
+
+    def queue_for(self, guild_id):
+        queue = self.queues.get(guild_id)
+        if queue is None:
+            queue = self.queues[guild_id] = ModerationQueue()
+        return queue
+
+    async def sync_queues(self):
+        '''
+        Shared store only: catches the review queues up with the reports other processes filed, claimed, released or
+        closed (every DM arrives on shard 0, so any guild can get reports from elsewhere). Only what changed since
+        the last sync is read, off the event loop.
+        '''
+        self.queue_seq, changes = await self.flagged.changes(self.queue_seq)
+        expired = time.time() - review_claim_ttl
+        for record, claimed_by, claimed_at in changes:
+            queue = self.queue_for(record.guild_id)
+            if record.status != "open":
+                queue.done(record.report_id)
+            elif claimed_by is not None and (claimed_at or 0) > expired:
+                queue.push(record)
+                queue.claim(record.report_id)
+            elif record.report_id in queue.live:
+                queue.release(record)
+            else:
+                queue.push(record)
+
+    async def queue_status(self, guild_id):
+        if self.shared_store:
+            await self.sync_queues()
+        queue = self.queue_for(guild_id)
+        pending = queue.pending_by_tier()
+        latency = queue.latency_summary()
+        lines = [f"**Review queue:** {len(queue)} unclaimed report(s)"]
+        for tier, count in pending.items():
+            line = f"• {tier}: {count} waiting"
+            if tier in latency:
+                reviewed, p50, p90 = latency[tier]
+                line += f", time to first review p50 {p50 / 60:.1f} min, p90 {p90 / 60:.1f} min (last {reviewed})"
+            lines.append(line)
+        return "\n".join(lines)
 
     async def handle_dm(self, message):
         '''
@@ -135,7 +505,7 @@ class ModBot(discord.Client):
         if message.content == Report.HELP_KEYWORD:
             reply = "Use the `report` command to begin the reporting process.\n"
             reply += "Use the `cancel` command to cancel the report process.\n"
-            await message.channel.send(reply)
+            self.outbox.send(message.channel, reply)
             return
 
         author_id = message.author.id
@@ -157,8 +527,7 @@ class ModBot(discord.Client):
 
         # Handle message VIA SENDING TO REPORT.PY
         responses = await self.reports[author_id].handle_message(message)
-        for r in responses:
-            await message.channel.send(r)
+        self.outbox.send(message.channel, responses)
 
         # ****** Once a user submits their report, it's submitted as an embed to the mod channel ******
         # check if the author_id is in the reports dictionary once again because of the await it might have been removed
@@ -173,35 +542,73 @@ class ModBot(discord.Client):
         a 50% chance right now for the demo. Moderators can initiate the review process, which calls on review.py, to review posts that have been
         either auto-flagged or user-reported. Deletes the message of the user if the moderator decides that is the correct decision and simulates banning.
         '''
-        group_name = f'group-{self.group_num}'
-        mod_name   = f'{group_name}-mod'
-        channel_name = message.channel.name
-        mod_channel = self.mod_channels.get(message.guild.id)
+        route = self.router.route(message.channel.id)
+        mod_channel = message.channel
 
-        if channel_name == mod_name:
+        if route == MOD:
             author = message.author.id
             text   = message.content.strip().lower()
             # help
             if text == Review.HELP_KEYWORD:
-                reply  = "Use the `review <report_message_url>` command to begin the manual review process.\n"
+                reply  = "Use the `review <report_id>` command (or paste the link to the report's post) to begin the manual review process.\n"
+                reply += "Use the `review next` command to review the most urgent report nobody has picked up yet.\n"
+                reply += "Use the `queue` command to see how many reports are waiting.\n"
                 reply += "Use the `cancel` command to cancel the review process.\n"
-                return await mod_channel.send(reply)
+                return self.outbox.send(mod_channel, reply)
+
+            if text == "queue":
+                return self.outbox.send(mod_channel, await self.queue_status(message.guild.id))
 
             if text.startswith("review"):
                 parts = text.split(maxsplit=1)
                 if len(parts) != 2:
-                    return await mod_channel.send("❌ Usage: `review <embed_id|url>`")
-                
-                # pull the trailing digits
-                m = re.search(r'(\d+)$', parts[1].strip())
-                if not m:
-                    return await mod_channel.send("❌ Couldn't find an ID in that input.")
-                embed_id = int(m.group(1))
-
-                # lookup
-                report_obj = self.flagged.get(embed_id)
-                if not report_obj:
-                    return await mod_channel.send(f"❌ No report found with ID `{embed_id}`.")
+                    return self.outbox.send(mod_channel, "❌ Usage: `review <report_id|url>` or `review next`")
+
+                queue = self.queue_for(message.guild.id)
+                if parts[1].strip() == "next":
+                    if self.shared_store:
+                        await self.sync_queues()
+                    record = None
+                    while record is None:
+                        report_id = queue.pop_next()
+                        if report_id is None:
+                            return self.outbox.send(mod_channel, "✅ No unclaimed reports waiting for review.")
+                        record = self.flagged.get(report_id)
+                        if record is None or record.status != "open":
+                            # reviewed through another process, or gone
+                            queue.done(report_id)
+                            record = None
+                        elif self.shared_store and not await self.flagged.claim(report_id, author, review_claim_ttl):
+                            # a moderator on another process got to it first; it stays claimed here until a sync
+                            # shows it released
+                            record = None
+                else:
+                    # pull the trailing digits
+                    m = re.search(r'(\d+)$', parts[1].strip())
+                    if not m:
+                        return self.outbox.send(mod_channel, "❌ Couldn't find an ID in that input.")
+                    embed_id = int(m.group(1))
+
+                    # lookup, either by report ID or by the link to the mod channel post it appeared in
+                    record = self.flagged.get(embed_id) or self.flagged.get_by_mod_message(embed_id)
+                    if not record:
+                        return self.outbox.send(mod_channel, f"❌ No report found with ID `{embed_id}`.")
+                    queue.claim(record.report_id)
+                    if self.shared_store and record.status == "open":
+                        # asked for by ID, so reviewed even if someone else has it, but kept out of `review next`
+                        await self.flagged.claim(record.report_id, author, review_claim_ttl)
+
+                # a moderator switching reports gives up the one they had
+                previous = self.reviews.pop(author, None)
+                if previous is not None and previous.report.report_id != record.report_id:
+                    self.review_dropped(author, previous)
+
+                if record.first_reviewed is None:
+                    record.first_reviewed = time.time()
+                    self.flagged.put(record.report_id, record)
+                    queue.record_first_review(record)
+                self.outbox.send(mod_channel, f"Report `{record.report_id}` ({tier_for(record)} priority):")
+                report_obj = Report.from_record(self, record)
 
                 # instantiate & stash
                 rev = Review(self, report=report_obj)
@@ -209,107 +616,110 @@ class ModBot(discord.Client):
 
                 # fire off first prompt via handle_message
                 responses = await rev.handle_message(message)
-                for line in responses:
-                    await mod_channel.send(line)
+                self.outbox.send(mod_channel, responses)
                 return
 
             # ongoing review flow
             if author in self.reviews:
-                resp = await self.reviews[author].handle_message(message)
-                for line in resp:
-                    await mod_channel.send(line)
-                if self.reviews[author].state == ReviewState.REVIEW_COMPLETE:
-                    if self.reviews[author].q1_response == "yes":
-                        await self.reviews[author].message.delete()
-                        await mod_channel.send("Deleted user's message.")
-                    if self.reviews[author].q2_response == "yes":
-                        await mod_channel.send("Removed user from the server")
-                    del self.reviews[author]
+                review = self.reviews[author]
+                resp = await review.handle_message(message)
+                self.outbox.send(mod_channel, resp)
+                if review.state == ReviewState.REVIEW_COMPLETE:
+                    if review.cancelled or review.q1_response is None:
+                        # no decision was made: the report goes back in the queue for someone else
+                        self.review_dropped(author, review)
+                    else:
+                        deleted = False
+                        if review.q1_response == "yes":
+                            reported = await self.fetch_reported_message(review.guild_id, review.channel_id, review.message_id)
+                            if reported:
+                                await reported.delete()
+                                deleted = True
+                                self.outbox.send(mod_channel, "Deleted user's message.")
+                            else:
+                                self.outbox.send(mod_channel, "The reported message was already deleted.")
+                        if review.q2_response == "yes":
+                            self.outbox.send(mod_channel, "Removed user from the server")
+                        self.flagged.update(review.report.report_id, status="reviewed", reviewer_id=author,
+                                            q1_review=review.q1_response, q2_review=review.q2_response)
+                        self.queue_for(message.guild.id).done(review.report.report_id)
+                        log_event("review", report_id=review.report.report_id, guild_id=message.guild.id,
+                                  reviewer_id=author, q1_review=review.q1_response, q2_review=review.q2_response,
+                                  message_deleted=deleted)
+                    self.reviews.pop(author, None)
                 return
             return 
 
         # AUTO FLAGGING CODE
-        elif channel_name == group_name:
+        elif route == MONITORED:
         # forward raw text to mods
             #await mod_channel.send(f'Forwarded message:\n{message.author.name}: "{message.content}"')
-            scores = self.eval_text(message)
-
-            if scores == 1:
-                # build jump link
-                jump_url = f"https://discord.com/channels/{message.guild.id}/{message.channel.id}/{message.id}"
-                auto_report = Report(self)
-                auto_report.message         = message
-                auto_report.type_selected   = "automated"
-                auto_report.subtype_selected = "suspect_content"
-                auto_report.author_id       = message.author.id
-                auto_report.guild_id        = message.guild.id
-
-                embed = discord.Embed(
-                    title="Auto-Flagged Message",
-                    description=f"Suspect score: {scores:.2%}",
-                    color=discord.Color.orange()
-                )
-                embed.add_field(name="Author",  value=message.author.mention, inline=True)
-                embed.add_field(name="Channel", value=message.channel.mention,      inline=True)
-                embed.add_field(name="Content", value=message.content[:1024],      inline=False)
-                embed.add_field(
-                    name="Jump to Message",
-                    value=f"[Click here to view original message]({jump_url})",
-                    inline=False
-                )
-                embed.add_field(
-                        name="Message Link",
-                        # inline code span prevents auto-linking
-                        value=f"`{jump_url}`",
-                        inline=True
-                    )
-                
-                mod_msg = await mod_channel.send(embed=embed)
-                embed.set_footer(text=f"Report ID: {mod_msg.id}")
-                await mod_msg.edit(embed=embed)
-                self.flagged[mod_msg.id] = auto_report
-
-            else:
-                await mod_channel.send(self.code_format(scores))
-
+            # Scoring runs in the background so on_message returns without waiting on the classifier
+            self.admission.submit(message)
 
-    def is_AI_generated(self, image_url):
-
-        aiplatform.init(project=project_id, location=region, credentials=self.credentials)
-        endpoint = aiplatform.Endpoint(
-            endpoint_name=f"projects/{project_id}/locations/{region}/endpoints/{endpoint_id}"
-        )
+    @metrics.timed("auto_flag")
+    async def auto_flag(self, message):
+        '''
+        Scores a message from the group channel and raises an auto-flag report when the text scorer or the image
+        classifier rates it above its threshold. Nothing is posted for messages below both thresholds.
+        '''
+        score, attachment_scores, text = await self.eval_text(message)
+        await self.raise_flag(message, score, attachment_scores, text)
 
-        # download the image from provided (discord) URL
-        response = requests.get(image_url)
-        if response.status_code != 200:
-            print(f"Failed to download image. Status code: {response.status_code}")
-            return
+    def shed_unchecked(self, message):
+        self.scan_stats.record_unchecked(message.guild.id)
 
-        # open the image with some error handling
-        try:
-            image = Image.open(io.BytesIO(response.content)).convert("RGB")
-        except Exception as e:
-            print(f"Error opening image: {e}")
+    async def auto_flag_degraded(self, message, reason):
+        '''
+        What auto_flag falls back on for messages admission control sheds: the text scorer and generator file
+        names only, with no downloads or classifier calls.
+        '''
+        text = self.text_scorer.score(message.content)
+        attachment_scores = [(attachment.filename, FILENAME_SCORE if generator_filename(attachment.filename) else None)
+                             for attachment in message.attachments
+                             if (attachment.content_type or "").lower() in self.IMAGE_TYPES]
+        score = max((conf for _, conf in attachment_scores if conf is not None), default=0)
+        await self.raise_flag(message, score, attachment_scores, text, degraded=True)
+
+    async def raise_flag(self, message, score, attachment_scores, text, degraded=False):
+        text_flagged = text is not None and text.score > text_threshold
+        flagged = text_flagged or score > ai_threshold
+        self.scan_stats.record_message(message.guild.id, flagged, degraded=degraded)
+        if not flagged:
             return
 
-        # create instance object for prediction with base64 encoding
-        buffer = io.BytesIO()
-        image.save(buffer, format="JPEG")
-        jpeg_bytes = buffer.getvalue()
-        b64_image = base64.b64encode(jpeg_bytes).decode("utf-8")
-        instances = [{"content": b64_image}]
-
-        prediction = endpoint.predict(instances=instances)
-
-        # Make the prediction
-        try:
-            predictions = endpoint.predict(instances=instances).predictions[0].get('confidences')[1]
-            logger.info(f"Completed a prediction, prob of AI: {predictions}")
-        except Exception as e:
-            print(f"Error during prediction: {e}")
-
-        return predictions > 0.5  # if confidence is greater than 50%, return True for AI generated else False
+        auto_report = Report(self)
+        auto_report.set_message(message)
+        auto_report.type_selected   = "automated"
+        # a text flag carries the subtype it matched, so it's ranked and shown like a user report of that subtype
+        auto_report.subtype_selected = text.subtype if text_flagged else "suspect_content"
+        auto_report.author_id       = message.author.id
+        auto_report.guild_id        = message.guild.id
+        if text_flagged:
+            score = max(score, text.score)
+        await self.send_report_embed(auto_report, score=score, attachment_scores=attachment_scores)
+
+
+    @metrics.timed("is_AI_generated")
+    async def is_AI_generated(self, attachment):
+        # Download, decode and prediction all happen off the event loop, see classifier.py.
+        # Returns the probability the image is AI generated, or None if it couldn't be scored.
+        # When we can, ask Discord's media proxy for a copy already shrunk to the model's input size,
+        # falling back to the full-size original
+        if screen_attachment(attachment):
+            # Emoji-sized, nearly empty or banner-shaped: not worth a round trip to the endpoint
+            return None
+        start = time.monotonic()
+        proxy_url = resized_proxy_url(attachment, self.classifier.input_size)
+        if proxy_url:
+            self.classifier.stats['proxy_resized'] += 1
+            confidence = await self.classifier.classify(proxy_url, fallback_url=attachment.url,
+                                                        original_size=attachment.size,
+                                                        content_type=attachment.content_type)
+        else:
+            confidence = await self.classifier.classify(attachment.url, original_size=attachment.size)
+        self.scan_stats.record_classifier(time.monotonic() - start)
+        return confidence
 
         # # use openai to check if the image is AI generated ask if it's ai generated or not
         # # api_key = os.getenv("OPENAI_API_KEY")
@@ -337,41 +747,43 @@ class ModBot(discord.Client):
         # # Return 1 if the response indicates AI-generated, 0 otherwise
         # return True if 'yes' in result else False
 
-    def eval_text(self, message):
-        # print msg image if it exists
-        if message.attachments:
-            for attachment in message.attachments:
-                # Get content type and convert to lowercase for case-insensitive comparison
-                content_type = attachment.content_type.lower() if attachment.content_type else ""
-                
-                # Check for all common image formats
-                valid_types = [
-                    "image/png",
-                    "image/jpeg",
-                    "image/jpg",
-                    "image/gif",
-                    "image/webp",
-                    "image/tiff",
-                    "image/bmp"
-                ]
-                
-                if content_type in valid_types:
-                    try:    
-                        return self.is_AI_generated(attachment.url)
-                    except Exception as e:
-                        logger.error(f"Error checking if image is AI-generated: {str(e)}")
-                
-        return 0
-
-    
-    def code_format(self, text):
-        ''''
-        TODO: Once you know how you want to show that a message has been 
-        evaluated, insert your code here for formatting the string to be 
-        shown in the mod channel. 
+    @metrics.timed("eval_text")
+    async def eval_text(self, message):
         '''
-        return "Evaluated: '" + str(text)+ "'"
-
-
-client = ModBot()
-client.run(discord_token)
\ No newline at end of file
+        Scores the message text in-process and every image attachment on the message in parallel. Returns the
+        highest AI-generated confidence (0 if nothing could be scored), a list of (filename, confidence) pairs,
+        one per image, where confidence is None for attachments that failed or timed out, and the text scorer's
+        TextVerdict (None if nothing in the text matched). One slow or broken attachment doesn't hold up the
+        others since each is scored (and timed out) independently.
+        '''
+        text = self.text_scorer.score(message.content)
+
+        # Get content type and convert to lowercase for case-insensitive comparison
+        images = [attachment for attachment in message.attachments
+                  if (attachment.content_type or "").lower() in self.IMAGE_TYPES]
+        if not images:
+            return 0, [], text
+
+        results = await asyncio.gather(*[self.is_AI_generated(attachment) for attachment in images],
+                                       return_exceptions=True)
+        attachment_scores = []
+        for attachment, result in zip(images, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error checking if image is AI-generated: {str(result)}")
+                result = None
+            attachment_scores.append((attachment.filename, result))
+
+        scored = [conf for _, conf in attachment_scores if conf is not None]
+        return (max(scored) if scored else 0), attachment_scores, text
+
+
+
+if __name__ == "__main__":
+    listener = start_logging()
+    try:
+        tokens = load_tokens()
+        client = ModBot(tokens['google'])
+        # Our queue handler already logs to the console; discord.py's default handler would write synchronously
+        client.run(tokens['discord'], log_handler=None)
+    finally:
+        listener.stop()
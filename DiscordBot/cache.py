@@ -0,0 +1,177 @@
+# cache.py
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('discord')
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def perceptual_hash(image):
+    '''
+    64-bit difference hash (dHash) of a PIL image. Re-encoded, recompressed or resized copies of the same picture
+    land within a few bits of each other, unlike the content hash which changes with every byte.
+    '''
+    from PIL import Image  # already loaded by whoever decoded image; not imported at startup
+
+    small = image.convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+class VerdictCache:
+    '''
+    Classifier verdicts keyed by the SHA-256 of the attachment bytes, with an optional perceptual-hash index for
+    near-duplicates. Entries are evicted least-recently-used once max_entries is reached and expire after ttl
+    seconds. If path is given, verdicts are also written to a SQLite file and reloaded on startup; those writes
+    happen on a background thread, outside the lock, so a lookup never waits on the disk.
+
+    Methods are thread-safe and only touch memory, so they can be called from the event loop.
+    '''
+
+    def __init__(self, max_entries=10000, ttl=24 * 60 * 60, path=None, perceptual=True, max_distance=3):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.perceptual = perceptual
+        self.max_distance = max_distance
+
+        self.entries = OrderedDict() # content hash -> (confidence, perceptual hash or None, time stored)
+        # Split each 64-bit perceptual hash into max_distance + 1 bands. Two hashes within max_distance bits
+        # must agree exactly on at least one band, so a lookup only compares against hashes sharing a band.
+        self.num_bands = max_distance + 1
+        self.band_bits = 64 // self.num_bands
+        self.bands = {} # (band index, band value) -> set of content hashes
+
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+        self.db = None
+        self.writer = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            # A crash can lose the last few verdicts but not corrupt the file; they'd just be scored again
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            # Shard processes (see shards.py) share this file
+            self.db.execute("PRAGMA busy_timeout=5000")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, phash TEXT, confidence REAL, created REAL)"
+            )
+            self.load()
+            self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='verdict-cache')
+
+    def load(self):
+        cutoff = time.time() - self.ttl
+        self.db.execute("DELETE FROM verdicts WHERE created < ?", (cutoff,))
+        self.db.commit()
+        rows = self.db.execute(
+            "SELECT key, phash, confidence, created FROM verdicts ORDER BY created DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        # Insert oldest first so the most recent rows end up at the fresh end of the LRU
+        for key, phash, confidence, created in reversed(rows):
+            self.insert(key, confidence, int(phash, 16) if phash else None, created)
+
+    def band_keys(self, phash):
+        mask = (1 << self.band_bits) - 1
+        return [(i, (phash >> (i * self.band_bits)) & mask) for i in range(self.num_bands)]
+
+    def insert(self, key, confidence, phash, created):
+        if key in self.entries:
+            self.remove(key)
+        self.entries[key] = (confidence, phash, created)
+        if phash is not None:
+            for band in self.band_keys(phash):
+                self.bands.setdefault(band, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            oldest = next(iter(self.entries))
+            self.remove(oldest)
+            self.stats['evictions'] += 1
+
+    def remove(self, key):
+        _, phash, _ = self.entries.pop(key)
+        if phash is not None:
+            for band in self.band_keys(phash):
+                keys = self.bands.get(band)
+                if keys:
+                    keys.discard(key)
+                    if not keys:
+                        del self.bands[band]
+
+    def fresh(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[2] > self.ttl:
+            self.remove(key)
+            self.stats['expired'] += 1
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def get(self, key):
+        '''Returns the cached confidence for a content hash, or None.'''
+        with self.lock:
+            entry = self.fresh(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            return entry[0]
+
+    def get_similar(self, phash):
+        '''Returns the confidence of a cached image within max_distance bits of phash, or None.'''
+        with self.lock:
+            candidates = set()
+            for band in self.band_keys(phash):
+                candidates |= self.bands.get(band, set())
+            for key in candidates:
+                entry = self.fresh(key)
+                if entry is not None and bin(entry[1] ^ phash).count("1") <= self.max_distance:
+                    self.stats['perceptual_hits'] += 1
+                    return entry[0]
+            self.stats['perceptual_misses'] += 1
+            return None
+
+    def put(self, key, confidence, phash=None):
+        created = time.time()
+        with self.lock:
+            self.insert(key, confidence, phash, created)
+        if self.writer is not None:
+            future = self.writer.submit(self.write, key, format(phash, "016x") if phash is not None else None,
+                                        confidence, created)
+            future.add_done_callback(self.log_write_error)
+
+    def write(self, key, phash, confidence, created):
+        # Only ever runs on the writer thread
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO verdicts (key, phash, confidence, created) VALUES (?, ?, ?, ?)",
+                            (key, phash, confidence, created))
+
+    def log_write_error(self, future):
+        if future.exception() is not None:
+            logger.error(f"Error writing a verdict to the cache file: {future.exception()}")
+
+    def hit_rate(self):
+        # coalesced lookups missed the cache but shared an in-flight prediction, so they cost no endpoint call
+        hits = self.stats['hits'] + self.stats['perceptual_hits'] + self.stats['coalesced']
+        lookups = self.stats['hits'] + self.stats['misses']
+        return hits / lookups if lookups else 0.0
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.shutdown(wait=True)
+        if self.db is not None:
+            self.db.close()
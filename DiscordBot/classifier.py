@@ -0,0 +1,369 @@
+# classifier.py
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+from cache import VerdictCache, content_hash
+from preprocess import MODEL_INPUT_SIZE, prepare_image
+from instrumentation import metrics
+from triage import FLAG, FORWARD, GENERATOR_SCORE, METADATA_PREFIX_BYTES, METADATA_PREFIX_TYPES, SKIP, inspect_image
+
+logger = logging.getLogger('discord')
+
+
+class ImageClassifier:
+    '''
+    Async front end for the Vertex AI-image endpoint. Attachments are downloaded with a shared aiohttp session,
+    and the blocking parts (PIL decoding and the endpoint call) run on a bounded thread pool, so scoring an image
+    never stalls the event loop that serves every other guild, DM report flow and mod review.
+
+    Pass endpoint to predict through something other than a Vertex Endpoint, or scorer to hand each downloaded
+    image to another process for everything after triage (hashing, decoding, the verdict cache and the
+    prediction), e.g. shards.RemoteScorer; its async score(data) returns the confidence or None.
+
+    The Vertex SDK and the service account credentials (from service_account_info) are only loaded when the first
+    image needs scoring, or earlier if warm_up() is called, so they don't hold up connecting to Discord.
+    '''
+
+    def __init__(self, service_account_info, project_id, region, endpoint_id, max_concurrency=4, timeout=15.0,
+                 max_batch_size=8, max_batch_wait=0.01, cache=None, max_download_bytes=10_000_000,
+                 input_size=MODEL_INPUT_SIZE, endpoint=None, scorer=None):
+        self.service_account_info = service_account_info
+        self.project_id = project_id
+        self.region = region
+        self.endpoint_id = endpoint_id
+        self.timeout = timeout
+        self.max_download_bytes = max_download_bytes
+        self.input_size = input_size
+        self.scorer = scorer
+
+        # At most max_concurrency images are downloaded/decoded at once; the rest wait their turn
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='classifier')
+        self.session = None
+
+        # Decoded images are grouped into a single predict(instances=[...]) call per burst
+        self.batcher = PredictionBatcher(self.predict_batch, self.executor,
+                                         max_batch_size=max_batch_size, max_wait=max_batch_wait)
+
+        # Reposted images are answered from the verdict cache; identical images already being scored share
+        # the in-flight result instead of each going to the endpoint
+        self.cache = cache if cache is not None else VerdictCache()
+        self.inflight = {} # content hash -> future resolved with that image's confidence
+
+        # One Vertex endpoint client, built on first use and shared by every worker thread
+        self.endpoint = endpoint # anything with aiplatform.Endpoint's predict(); created on first use if not given
+        self.endpoint_lock = threading.Lock()
+
+        # predict_calls: requests actually sent to Vertex. round_trips_saved: endpoint lookups and duplicate
+        # predict calls we no longer make compared to building a fresh client for every image.
+        self.stats = Counter()
+
+    def get_endpoint(self):
+        if self.endpoint is None:
+            with self.endpoint_lock:
+                if self.endpoint is None:
+                    # Importing the SDK alone takes seconds, so it waits until an image actually needs scoring
+                    from google.cloud import aiplatform
+                    from google.oauth2 import service_account
+
+                    credentials = (service_account.Credentials.from_service_account_info(self.service_account_info)
+                                   if self.service_account_info else None)
+                    aiplatform.init(project=self.project_id, location=self.region, credentials=credentials)
+                    self.endpoint = aiplatform.Endpoint(
+                        endpoint_name=f"projects/{self.project_id}/locations/{self.region}/endpoints/{self.endpoint_id}"
+                    )
+                    self.stats['endpoint_inits'] += 1
+                    return self.endpoint
+        self.stats['round_trips_saved'] += 1
+        return self.endpoint
+
+    async def warm_up(self):
+        '''Loads PIL, the Vertex SDK and the endpoint client on the worker pool, off the event loop.'''
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            await loop.run_in_executor(self.executor, self._warm_up)
+        except Exception as e:
+            logger.warning(f"Classifier warm-up failed, will retry on first use: {e}")
+            return
+        logger.info(f"Classifier warmed up in {time.perf_counter() - start:.2f}s")
+
+    def _warm_up(self):
+        from PIL import Image
+        Image.preinit()  # loads the common format plugins, which Image.open would otherwise do on first use
+        if self.endpoint is None:
+            self.get_endpoint()
+
+    async def get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+        if self.scorer is not None:
+            await self.scorer.close()
+        self.executor.shutdown(wait=False)
+        self.cache.close()
+
+    async def classify(self, image_url, fallback_url=None, original_size=None, content_type=None):
+        '''
+        Returns the endpoint's confidence that the image at image_url is AI-generated, or None if the image
+        could not be downloaded, decoded or scored within the timeout. If image_url is a resized proxy variant,
+        fallback_url is the original to fetch when the proxy can't serve it, and original_size and content_type
+        describe that original.
+        '''
+        if original_size:
+            self.stats['bytes_original'] += original_size
+        try:
+            return await asyncio.wait_for(self._classify(image_url, fallback_url, content_type), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timed out after {self.timeout}s classifying {image_url}")
+            return None
+
+    async def _classify(self, image_url, fallback_url=None, content_type=None):
+        async with self.semaphore:
+            header = None
+            header_download = None
+            if fallback_url and (content_type or "").lower() in METADATA_PREFIX_TYPES:
+                # image_url is a resized proxy copy, re-encoded without the original's metadata: read that from
+                # the start of the original while the copy downloads
+                header_download = asyncio.create_task(self.download_header(fallback_url))
+            download = asyncio.create_task(self.download(image_url))
+            try:
+                if header_download is not None:
+                    header = await header_download
+                    if header is not None:
+                        verdict = self.triage(header)
+                        if verdict != FORWARD:
+                            if not download.done():
+                                self.stats['downloads_cancelled'] += 1
+                            return verdict
+                data = await download
+            finally:
+                # Only still running if we returned early or timed out
+                download.cancel()
+                if header_download is not None:
+                    header_download.cancel()
+            if data is None and fallback_url:
+                self.stats['proxy_fallbacks'] += 1
+                data = await self.download(fallback_url)
+        if data is None:
+            return None
+
+        if header is None:
+            verdict = self.triage(data)
+            if verdict != FORWARD:
+                return verdict
+
+        if self.scorer is not None:
+            return await self.scorer.score(data)
+        return await self.classify_bytes(data)
+
+    async def classify_bytes(self, data):
+        '''Confidence for an image already downloaded and triaged: from the verdict cache, or scored.'''
+        loop = asyncio.get_running_loop()
+        key = await loop.run_in_executor(self.executor, content_hash, data)
+        confidence = self.cache.get(key)
+        if confidence is not None:
+            return confidence
+
+        if key in self.inflight:
+            self.cache.stats['coalesced'] += 1
+            return await asyncio.shield(self.inflight[key])
+
+        future = loop.create_future()
+        self.inflight[key] = future
+        confidence = None
+        try:
+            confidence = await self.score(key, data)
+            return confidence
+        finally:
+            del self.inflight[key]
+            future.set_result(confidence)
+
+    def triage(self, data):
+        '''
+        Header-only checks, cheap enough to run on the loop: animations aren't scored (None), and images whose
+        metadata names a generator don't need the endpoint to tell us (GENERATOR_SCORE). FORWARD otherwise.
+        '''
+        action, _ = inspect_image(data)
+        if action == SKIP:
+            self.stats['triage_skipped'] += 1
+            return None
+        if action == FLAG:
+            self.stats['triage_flagged'] += 1
+            return GENERATOR_SCORE
+        return FORWARD
+
+    async def score(self, key, data):
+        loop = asyncio.get_running_loop()
+        prepared = await loop.run_in_executor(self.executor, self.encode_image, data)
+        if prepared is None:
+            return None
+        instance, phash = prepared
+
+        if phash is not None:
+            confidence = self.cache.get_similar(phash)
+            if confidence is not None:
+                return confidence
+
+        confidence = await self.batcher.submit(instance)
+        if confidence is not None:
+            self.cache.put(key, confidence, phash)
+        return confidence
+
+    @metrics.timed("image_download")
+    async def download(self, image_url):
+        '''
+        Streams the image from the provided (discord) URL, giving up as soon as it grows past max_download_bytes
+        rather than buffering a huge upload we were never going to score.
+        '''
+        session = await self.get_session()
+        try:
+            async with session.get(image_url) as response:
+                if response.status != 200:
+                    logger.warning(f"Failed to download image. Status code: {response.status}")
+                    return None
+                if (response.content_length or 0) > self.max_download_bytes:
+                    self.stats['downloads_too_large'] += 1
+                    return None
+
+                chunks = []
+                size = 0
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    size += len(chunk)
+                    if size > self.max_download_bytes:
+                        self.stats['downloads_too_large'] += 1
+                        return None
+                    chunks.append(chunk)
+                self.stats['bytes_fetched'] += size
+                return b"".join(chunks)
+        except aiohttp.ClientError as e:
+            logger.warning(f"Error downloading image: {e}")
+            return None
+
+    @metrics.timed("image_header_download")
+    async def download_header(self, image_url):
+        '''
+        The first METADATA_PREFIX_BYTES of the image at image_url, or None if it couldn't be fetched. Only that
+        range is requested, and a server that ignores the Range header is cut off after it anyway.
+        '''
+        session = await self.get_session()
+        try:
+            async with session.get(image_url, headers={"Range": f"bytes=0-{METADATA_PREFIX_BYTES - 1}"}) as response:
+                if response.status not in (200, 206):
+                    logger.warning(f"Failed to download image header. Status code: {response.status}")
+                    return None
+                chunks = []
+                size = 0
+                async for chunk in response.content.iter_chunked(16 * 1024):
+                    chunks.append(chunk)
+                    size += len(chunk)
+                    if size >= METADATA_PREFIX_BYTES:
+                        break
+                self.stats['header_bytes_fetched'] += size
+                return b"".join(chunks)[:METADATA_PREFIX_BYTES]
+        except aiohttp.ClientError as e:
+            logger.warning(f"Error downloading image header: {e}")
+            return None
+
+    def encode_image(self, data):
+        # open the image with some error handling
+        try:
+            b64_image, phash = prepare_image(data, max_side=self.input_size, perceptual=self.cache.perceptual)
+        except Exception as e:
+            logger.warning(f"Error opening image: {e}")
+            return None
+
+        # create instance object for prediction with base64 encoding
+        return {"content": b64_image}, phash
+
+    def predict_batch(self, instances):
+        '''
+        Runs on the worker pool (the Vertex client is synchronous). Sends every instance in one request and
+        returns the AI-generated confidence for each, in order.
+        '''
+        endpoint = self.get_endpoint()
+
+        # Make the prediction
+        self.stats['predict_calls'] += 1
+        self.stats['images_predicted'] += len(instances)
+        # The old path sent every image to the endpoint twice, one request each
+        self.stats['round_trips_saved'] += 2 * len(instances) - 1
+        predictions = endpoint.predict(instances=instances).predictions
+        confidences = [p.get('confidences')[1] for p in predictions]
+        logger.info(f"Completed a prediction for {len(instances)} image(s), prob of AI: {confidences}")
+        return confidences
+
+
+class PredictionBatcher:
+    '''
+    Collects decoded images for up to max_wait seconds (or until max_batch_size / max_batch_bytes is reached)
+    and sends them to the endpoint in a single call, then hands each confidence back to the coroutine that
+    submitted the image. A raid posting dozens of images becomes a handful of requests instead of dozens.
+    '''
+
+    # Vertex online prediction rejects request bodies over 1.5MB
+    MAX_BATCH_BYTES = 1_500_000
+
+    def __init__(self, predict_batch, executor, max_batch_size=8, max_wait=0.01, max_batch_bytes=MAX_BATCH_BYTES):
+        self.predict_batch = predict_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_batch_bytes = max_batch_bytes
+
+        self.pending = [] # (instance, future) pairs waiting for the next flush
+        self.pending_bytes = 0
+        self.flush_handle = None
+        self.running = set()
+
+    async def submit(self, instance):
+        loop = asyncio.get_running_loop()
+        size = len(instance["content"])
+        if self.pending and self.pending_bytes + size > self.max_batch_bytes:
+            self.flush()
+
+        future = loop.create_future()
+        self.pending.append((instance, future))
+        self.pending_bytes += size
+
+        if len(self.pending) >= self.max_batch_size:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.max_wait, self.flush)
+        return await future
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.pending, self.pending_bytes = self.pending, [], 0
+        if not batch:
+            return
+        task = asyncio.ensure_future(self.run_batch(batch))
+        self.running.add(task)
+        task.add_done_callback(self.running.discard)
+
+    async def run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            metrics.count("vertex_calls")
+            with metrics.timer("vertex_predict"):
+                confidences = await loop.run_in_executor(self.executor, self.predict_batch, [i for i, _ in batch])
+        except Exception as e:
+            logger.error(f"Error during prediction: {e}")
+            confidences = [None] * len(batch)
+
+        # Submitters that timed out have already cancelled their future
+        for (_, future), confidence in zip(batch, confidences):
+            if not future.done():
+                future.set_result(confidence)
@@ -0,0 +1,233 @@
+# instrumentation.py
+import asyncio
+import functools
+import re
+import time
+from collections import Counter
+
+
+class Histogram:
+    '''
+    HDR-style latency histogram. Durations are recorded in whole microseconds into log-linear buckets: exact
+    below 32us, then 16 buckets per power of two, so any percentile is within ~6% of the true value from
+    microseconds up to hours, in memory proportional to the number of buckets actually hit.
+    '''
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = Counter() # bucket index -> samples
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def index(us):
+        if us < 32:
+            return us
+        shift = us.bit_length() - 5
+        return 32 + (shift - 1) * 16 + (us >> shift) - 16
+
+    @staticmethod
+    def value(index):
+        # Midpoint of the bucket, in microseconds
+        if index < 32:
+            return index
+        shift = (index - 32) // 16 + 1
+        low = ((index - 32) % 16 + 16) << shift
+        return low + ((1 << shift) - 1) / 2
+
+    def record(self, seconds):
+        seconds = max(seconds, 0.0)
+        self.counts[self.index(int(seconds * 1_000_000))] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        '''Approximate q-quantile (0 < q <= 1) in seconds, or None if nothing was recorded.'''
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self.value(index) / 1_000_000, self.max)
+        return self.max
+
+
+class Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class NullTimer:
+    '''What timer() hands out while instrumentation is off, so a disabled `with` block costs two no-op calls.'''
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+def label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def label_text(labels):
+    escaped = (name + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+               for name, value in labels)
+    return "{" + ",".join(escaped) + "}" if labels else ""
+
+
+class Instrumentation:
+    '''
+    Per-stage latency histograms and call counters for the bot's hot paths, plus event loop lag sampling.
+    Use timed() on functions, timer() around blocks, and count() for events. Everything checks `enabled` first,
+    so switching it off leaves one attribute lookup per instrumented call.
+
+    prometheus() renders everything (and any counter sources registered with add_source, such as the
+    classifier's stats) in the Prometheus text exposition format.
+    '''
+
+    QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+    def __init__(self, enabled=True, prefix="modbot"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.histograms = {} # (name, sorted label pairs) -> Histogram of seconds
+        self.counters = Counter() # (name, sorted label pairs) -> count
+        self.sources = {} # name -> callable returning a mapping of counter name -> value
+        self.lag_task = None
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, label_key(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.record(seconds)
+
+    def count(self, name, n=1, **labels):
+        if self.enabled:
+            self.counters[(name, label_key(labels))] += n
+
+    def timer(self, name, **labels):
+        return Timer(self, name, labels) if self.enabled else NULL_TIMER
+
+    def timed(self, name, labels=None):
+        '''
+        Decorator recording each call's duration (sync or async) in the `name` histogram. labels, if given,
+        is called with the function's arguments before the call and returns the labels for that sample.
+        '''
+        def decorate(fn):
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await fn(*args, **kwargs)
+                    sample_labels = labels(*args, **kwargs) if labels else {}
+                    start = time.perf_counter()
+                    try:
+                        return await fn(*args, **kwargs)
+                    finally:
+                        self.observe(name, time.perf_counter() - start, **sample_labels)
+            else:
+                @functools.wraps(fn)
+                def wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return fn(*args, **kwargs)
+                    sample_labels = labels(*args, **kwargs) if labels else {}
+                    start = time.perf_counter()
+                    try:
+                        return fn(*args, **kwargs)
+                    finally:
+                        self.observe(name, time.perf_counter() - start, **sample_labels)
+            return wrapper
+        return decorate
+
+    def add_source(self, name, counters):
+        self.sources[name] = counters
+
+    def start_lag_sampler(self, interval=0.5):
+        if self.enabled and self.lag_task is None:
+            self.lag_task = asyncio.create_task(self.sample_lag(interval))
+
+    def stop_lag_sampler(self):
+        if self.lag_task is not None:
+            self.lag_task.cancel()
+            self.lag_task = None
+
+    async def sample_lag(self, interval):
+        # How much later than asked for the loop wakes us up: time other callbacks held it
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            self.observe("event_loop_lag", loop.time() - start - interval)
+
+    def instrument_http(self, http):
+        '''Counts and times every Discord REST request made through a discord.py HTTPClient, by route.'''
+        request = http.request
+
+        @functools.wraps(request)
+        async def counted_request(route, **kwargs):
+            if not self.enabled:
+                return await request(route, **kwargs)
+            self.count("discord_api_calls", method=route.method, route=route.path)
+            with self.timer("discord_api", method=route.method, route=route.path):
+                return await request(route, **kwargs)
+
+        http.request = counted_request
+
+    def metric_name(self, name):
+        return re.sub(r"[^a-zA-Z0-9_]", "_", f"{self.prefix}_{name}")
+
+    def prometheus(self):
+        lines = []
+        for name in sorted({name for name, _ in self.histograms}):
+            metric = self.metric_name(f"{name}_seconds")
+            lines.append(f"# TYPE {metric} summary")
+            for (key_name, labels), histogram in sorted(self.histograms.items()):
+                if key_name != name:
+                    continue
+                for q in self.QUANTILES:
+                    lines.append(f"{metric}{label_text(labels + (('quantile', str(q)),))} {histogram.percentile(q):.6f}")
+                lines.append(f"{metric}_sum{label_text(labels)} {histogram.sum:.6f}")
+                lines.append(f"{metric}_count{label_text(labels)} {histogram.count}")
+
+        for name in sorted({name for name, _ in self.counters}):
+            metric = self.metric_name(f"{name}_total")
+            lines.append(f"# TYPE {metric} counter")
+            for (key_name, labels), value in sorted(self.counters.items()):
+                if key_name == name:
+                    lines.append(f"{metric}{label_text(labels)} {value}")
+
+        for source, counters in sorted(self.sources.items()):
+            for name, value in sorted(counters().items()):
+                metric = self.metric_name(f"{source}_{name}_total")
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared by every module, so decorators can be applied at import time
+metrics = Instrumentation()
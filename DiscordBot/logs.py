@@ -0,0 +1,104 @@
+# logs.py
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+logger = logging.getLogger('discord')
+moderation_logger = logging.getLogger('discord.moderation')
+
+TEXT_FORMAT = '%(asctime)s:%(levelname)s:%(name)s: %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    '''One JSON object per line: time, level, logger and message, plus the fields of a moderation event.'''
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        event = getattr(record, "event", None)
+        if event is not None:
+            entry["event"] = event
+            entry.update(record.fields)
+        else:
+            entry["message"] = record.getMessage()
+        return json.dumps(entry, default=str)
+
+
+class DebugSampler(logging.Filter):
+    '''
+    Keeps every record at INFO and above but only one DEBUG record in every `rate`. discord.py logs each
+    gateway event, payload and all, at DEBUG; sampling them keeps the log useful for spotting what the gateway
+    is doing without writing (or even formatting) every one.
+    '''
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self.seen = 0
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.INFO or self.rate <= 1:
+            return True
+        self.seen += 1
+        if self.seen % self.rate == 1:
+            return True
+        self.dropped += 1
+        return False
+
+
+def rotating_handler(path, max_bytes, backups, when):
+    if when:
+        return logging.handlers.TimedRotatingFileHandler(path, when=when, backupCount=backups, encoding='utf-8')
+    return logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+
+
+def setup_logging(path='discord.log', moderation_path='moderation.log', level=logging.DEBUG, max_bytes=20_000_000,
+                  backups=5, when=None, debug_sample=100, console=True):
+    '''
+    Routes the `discord` logger (discord.py's and ours) through a queue: the event loop only samples, formats the
+    message and enqueues it, and a background thread does the file and console writes. Logs rotate at max_bytes,
+    or on a schedule if `when` is given (TimedRotatingFileHandler's values, e.g. 'midnight'), keeping `backups`
+    old files, and are appended to rather than truncated on restart.
+
+    Moderation events (see log_event) are also written as JSON lines to moderation_path.
+    Returns the running QueueListener; stop() it on shutdown to flush what's left.
+    '''
+    main = rotating_handler(path, max_bytes, backups, when)
+    main.setFormatter(logging.Formatter(TEXT_FORMAT))
+    handlers = [main]
+    if moderation_path:
+        moderation = rotating_handler(moderation_path, max_bytes, backups, when)
+        moderation.setFormatter(JsonFormatter())
+        moderation.addFilter(logging.Filter(moderation_logger.name))
+        handlers.append(moderation)
+    if console:
+        stream = logging.StreamHandler(sys.stderr)
+        stream.setLevel(logging.INFO)
+        stream.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handlers.append(stream)
+
+    records = queue.SimpleQueue()
+    enqueue = logging.handlers.QueueHandler(records)
+    enqueue.addFilter(DebugSampler(debug_sample))
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(enqueue)
+    logger.setLevel(level)
+    # Our handlers cover the console too; don't also go through a synchronous root handler
+    logger.propagate = False
+    listener.start()
+    return listener
+
+
+def log_event(event, **fields):
+    '''Records a moderation event (a flag, report or review outcome) as structured fields.'''
+    moderation_logger.info(f"{event}: {fields}", extra={"event": event, "fields": fields})
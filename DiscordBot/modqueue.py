@@ -0,0 +1,208 @@
+# modqueue.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+import discord
+
+logger = logging.getLogger('discord')
+
+
+class TokenBucket:
+    '''Allows `rate` events per `per` seconds, with bursts of up to `rate`.'''
+
+    def __init__(self, rate, per):
+        self.capacity = rate
+        self.tokens = float(rate)
+        self.fill_rate = rate / per
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+        self.updated = now
+
+    def try_acquire(self):
+        self.refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        while not self.try_acquire():
+            await asyncio.sleep((1 - self.tokens) / self.fill_rate)
+
+
+class QueuedReport:
+    __slots__ = ("report_id", "channel_id", "embed", "digestible", "summary", "priority", "mod_message_id")
+
+    def __init__(self, report_id, channel_id, embed, digestible, summary, priority):
+        self.report_id = report_id
+        self.channel_id = channel_id
+        self.embed = embed
+        self.digestible = digestible
+        self.summary = summary
+        self.priority = priority
+        self.mod_message_id = None # set once posted
+
+
+class ModQueueWriter:
+    '''
+    Posts report embeds to mod channels from a background task per channel, so handlers only enqueue and return.
+
+    Each report goes out in a single send (the report ID is assigned locally and already in the footer). Sends
+    are paced by a token bucket matching Discord's per-channel message limit. While a channel is waiting on its
+    bucket, reports keep queueing up behind it; when it gets a token, every urgent report queued is posted on
+    its own, highest priority first, and the low-severity ones are merged into digest embeds of up to max_digest reports.
+
+    A posted report can be refreshed with a new embed (e.g. as more users report the same message). Refreshes
+    are coalesced so each mod post is edited at most once every edit_interval seconds.
+    '''
+
+    def __init__(self, store, rate=5, per=5.0, max_digest=10, edit_interval=10.0, max_tracked=5000):
+        self.store = store
+        self.rate = rate
+        self.per = per
+        self.max_digest = max_digest
+        self.edit_interval = edit_interval
+        self.max_tracked = max_tracked
+
+        self.queues = {} # channel id -> asyncio.Queue of QueuedReport, or mod message IDs due for an edit
+        self.buckets = {} # channel id -> TokenBucket
+        self.workers = {} # channel id -> writer task
+        self.items = OrderedDict() # report_id -> QueuedReport, for the most recent max_tracked reports
+        self.posts = {} # mod message id -> reports shown in it
+        self.last_edit = {} # mod message id -> when it was last sent or edited
+        self.pending_edits = set() # mod message ids with an edit queued or scheduled
+        self.edit_timers = {} # mod message id -> call_later handle of an edit not yet queued
+
+    def submit(self, channel, report_id, embed, digestible=False, summary=None, priority=0):
+        queue = self.queues.get(channel.id)
+        if queue is None:
+            queue = self.queues[channel.id] = asyncio.Queue()
+            self.buckets[channel.id] = TokenBucket(self.rate, self.per)
+        worker = self.workers.get(channel.id)
+        if worker is None or worker.done():
+            if worker is not None:
+                logger.error(f"Mod queue writer for channel {channel.id} had stopped; restarting it")
+            self.workers[channel.id] = asyncio.create_task(self.run(channel, queue, self.buckets[channel.id]))
+        item = QueuedReport(report_id, channel.id, embed, digestible, summary or embed.title, priority)
+        self.track(item)
+        queue.put_nowait(item)
+
+    def track(self, item):
+        self.items[item.report_id] = item
+        while len(self.items) > self.max_tracked:
+            _, old = self.items.popitem(last=False)
+            if old.mod_message_id is not None:
+                self.posts.pop(old.mod_message_id, None)
+                self.last_edit.pop(old.mod_message_id, None)
+
+    def refresh(self, report_id, embed, summary=None):
+        '''
+        Replaces a report's embed. If it's still queued the new one is simply what gets posted; otherwise an edit
+        of its mod post is scheduled. Returns False if the report isn't one this writer is tracking.
+        '''
+        item = self.items.get(report_id)
+        if item is None or (item.mod_message_id is not None and item.mod_message_id not in self.posts):
+            return False
+        item.embed = embed
+        if summary:
+            item.summary = summary
+        mod_message_id = item.mod_message_id
+        if mod_message_id is None or mod_message_id in self.pending_edits:
+            return True
+
+        self.pending_edits.add(mod_message_id)
+        delay = max(0.0, self.last_edit.get(mod_message_id, 0) + self.edit_interval - time.monotonic())
+        self.edit_timers[mod_message_id] = asyncio.get_running_loop().call_later(
+            delay, self.queue_edit, item.channel_id, mod_message_id)
+        return True
+
+    def queue_edit(self, channel_id, mod_message_id):
+        self.edit_timers.pop(mod_message_id, None)
+        queue = self.queues.get(channel_id)
+        if queue is not None:
+            queue.put_nowait(mod_message_id)
+
+    async def close(self):
+        for handle in self.edit_timers.values():
+            handle.cancel()
+        self.edit_timers.clear()
+        for task in self.workers.values():
+            task.cancel()
+        self.workers.clear()
+        self.queues.clear()
+
+    async def run(self, channel, queue, bucket):
+        while True:
+            entries = [await queue.get()]
+            await bucket.acquire()
+            while not queue.empty():
+                entries.append(queue.get_nowait())
+
+            items = [entry for entry in entries if isinstance(entry, QueuedReport)]
+            edits = [entry for entry in entries if not isinstance(entry, QueuedReport)]
+
+            urgent = sorted((item for item in items if not item.digestible), key=lambda item: -item.priority)
+            low = [item for item in items if item.digestible]
+            groups = [[item] for item in urgent]
+            if len(low) == 1:
+                groups.append(low)
+            else:
+                groups.extend(low[i:i + self.max_digest] for i in range(0, len(low), self.max_digest))
+
+            # One failed send mustn't stop the writer: everything queued behind it for this channel would never
+            # be posted
+            for n, group in enumerate(groups):
+                if n:
+                    await bucket.acquire()
+                try:
+                    await self.post(channel, group)
+                except Exception as e:
+                    logger.error(f"Error posting reports {[item.report_id for item in group]} to mod channel: {e}")
+            for n, mod_message_id in enumerate(edits):
+                if n or groups:
+                    await bucket.acquire()
+                try:
+                    await self.edit(channel, mod_message_id)
+                except Exception as e:
+                    logger.error(f"Error updating mod post {mod_message_id}: {e}")
+
+    def render(self, group):
+        return group[0].embed if len(group) == 1 else self.digest_embed(group)
+
+    async def post(self, channel, group):
+        try:
+            mod_msg = await channel.send(embed=self.render(group))
+        except discord.HTTPException as e:
+            logger.error(f"Error posting reports {[item.report_id for item in group]} to mod channel: {e}")
+            return
+        self.posts[mod_msg.id] = group
+        self.last_edit[mod_msg.id] = time.monotonic()
+        for item in group:
+            item.mod_message_id = mod_msg.id
+            self.store.update(item.report_id, mod_message_id=mod_msg.id)
+
+    async def edit(self, channel, mod_message_id):
+        self.pending_edits.discard(mod_message_id)
+        group = self.posts.get(mod_message_id)
+        if not group:
+            return
+        try:
+            await channel.get_partial_message(mod_message_id).edit(embed=self.render(group))
+        except discord.HTTPException as e:
+            logger.error(f"Error updating mod post {mod_message_id}: {e}")
+        self.last_edit[mod_message_id] = time.monotonic()
+
+    def digest_embed(self, group):
+        embed = discord.Embed(
+            title=f"🗂️ {len(group)} Low-Severity Reports",
+            description="Use `review <report_id>` to review any of these.",
+            color=discord.Color.light_grey()
+        )
+        for item in group:
+            embed.add_field(name=f"Report ID: {item.report_id}", value=item.summary[:1024], inline=False)
+        return embed
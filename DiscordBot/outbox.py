@@ -0,0 +1,80 @@
+# outbox.py
+import asyncio
+import logging
+from collections import deque
+
+import discord
+
+logger = logging.getLogger('discord')
+
+# Discord rejects messages longer than this
+MESSAGE_LIMIT = 2000
+
+
+def chunk_replies(lines, limit=MESSAGE_LIMIT):
+    '''
+    Joins reply strings with newlines into as few messages as fit under limit. Lines are never split unless a
+    single line is longer than limit on its own.
+    '''
+    chunks = []
+    current = ""
+    for line in lines:
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if not current:
+            current = line
+        elif len(current) + 1 + len(line) <= limit:
+            current += "\n" + line
+        else:
+            chunks.append(current)
+            current = line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class Outbox:
+    '''
+    Per-channel outbound queue for the report and review conversations. Handlers hand over their replies and
+    return straight away; a short-lived task per channel sends everything queued for that channel, in order,
+    merged into as few messages as possible. So a five-line prompt costs one round trip instead of five.
+    '''
+
+    def __init__(self, limit=MESSAGE_LIMIT):
+        self.limit = limit
+        self.queues = {} # channel id -> deque of reply lines
+        self.workers = {} # channel id -> task draining that channel's queue
+
+    def send(self, channel, lines):
+        if isinstance(lines, str):
+            lines = [lines]
+        if not lines:
+            return
+        self.queues.setdefault(channel.id, deque()).extend(lines)
+        if channel.id not in self.workers:
+            self.workers[channel.id] = asyncio.create_task(self.run(channel))
+
+    async def run(self, channel):
+        queue = self.queues[channel.id]
+        try:
+            while queue:
+                lines = list(queue)
+                queue.clear()
+                for chunk in chunk_replies(lines, self.limit):
+                    try:
+                        await channel.send(chunk)
+                    except discord.HTTPException as e:
+                        logger.error(f"Error sending reply to channel {channel.id}: {e}")
+        finally:
+            # No await between the emptiness check above and here, so nothing can be queued in between
+            del self.workers[channel.id]
+            if not queue:
+                del self.queues[channel.id]
+
+    async def flush(self):
+        while self.workers:
+            await asyncio.gather(*self.workers.values(), return_exceptions=True)
@@ -0,0 +1,90 @@
+# preprocess.py
+import base64
+import io
+from collections import Counter
+
+from cache import perceptual_hash
+
+# Longest side, in pixels, of the images we send to the classifier. The endpoint resizes its input anyway, so
+# anything bigger is bandwidth and CPU spent on pixels the model never sees.
+MODEL_INPUT_SIZE = 512
+JPEG_QUALITY = 90
+
+# Sum of libjpeg's standard luminance quantization table, which encoders scale by quality (see jpeg_quality)
+STANDARD_LUMA_TABLE_SUM = 3688
+
+# Formats Discord's media proxy will resize for us
+PROXY_RESIZABLE_TYPES = {"image/png", "image/jpeg", "image/jpg", "image/webp"}
+
+# Running totals for every image prepared, see benchmarks/bench_preprocess.py
+stats = Counter()
+
+
+def prepare_image(data, max_side=MODEL_INPUT_SIZE, perceptual=False):
+    '''
+    Turns downloaded attachment bytes into the base64 JPEG payload the endpoint expects. Returns
+    (b64_string, perceptual hash or None), or raises if PIL can't read the image.
+
+    - JPEGs that are already RGB, no bigger than max_side and saved at no more than JPEG_QUALITY are passed
+      through without being decoded; re-encoding one saved at a higher quality would make the payload smaller.
+    - Everything else is downscaled to max_side before encoding. For JPEGs, Image.draft lets the decoder
+      skip most of the work by decoding straight at 1/2, 1/4 or 1/8 scale.
+    '''
+    from PIL import Image  # loaded on first use (or by ImageClassifier.warm_up), not when the bot starts
+
+    image = Image.open(io.BytesIO(data))  # lazy: only the header has been read at this point
+    stats['images'] += 1
+    stats['bytes_in'] += len(data)
+
+    if (image.format == "JPEG" and image.mode == "RGB" and max(image.size) <= max_side
+            and jpeg_quality(image) <= JPEG_QUALITY):
+        stats['passthrough'] += 1
+        jpeg_bytes = data
+        phash = None
+        if perceptual:
+            image.draft("RGB", (64, 64))
+            phash = perceptual_hash(image)
+    else:
+        image.draft("RGB", (max_side, max_side))
+        image.thumbnail((max_side, max_side), Image.BILINEAR, reducing_gap=2.0)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=JPEG_QUALITY)
+        jpeg_bytes = buffer.getvalue()
+        phash = perceptual_hash(image) if perceptual else None
+
+    stats['bytes_out'] += len(jpeg_bytes)
+    return base64.b64encode(jpeg_bytes).decode("ascii"), phash
+
+
+def jpeg_quality(image):
+    '''
+    The libjpeg quality setting (1-100) a JPEG was most likely saved at, from its luminance quantization table
+    (read with the header, so nothing is decoded). Encoders with their own tables get the nearest equivalent;
+    100 if there's no table to go on.
+    '''
+    table = (getattr(image, "quantization", None) or {}).get(0)
+    if not table:
+        return 100
+    scale = sum(table) * 100 / STANDARD_LUMA_TABLE_SUM
+    return round((200 - scale) / 2 if scale <= 100 else 5000 / scale)
+
+
+def resized_proxy_url(attachment, max_side=MODEL_INPUT_SIZE):
+    '''
+    Returns a media proxy URL that makes Discord downscale the attachment to fit max_side before we download it,
+    or None if the original should be fetched (unknown dimensions, already small enough, or a format the proxy
+    won't resize).
+    '''
+    width, height = attachment.width, attachment.height
+    content_type = (attachment.content_type or "").lower()
+    if not width or not height or not attachment.proxy_url or content_type not in PROXY_RESIZABLE_TYPES:
+        return None
+    if max(width, height) <= max_side:
+        return None
+
+    scale = max_side / max(width, height)
+    separator = "&" if "?" in attachment.proxy_url else "?"
+    return (f"{attachment.proxy_url}{separator}width={max(1, round(width * scale))}"
+            f"&height={max(1, round(height * scale))}")
@@ -0,0 +1,130 @@
+# priority.py
+import heapq
+import math
+import time
+from collections import Counter, deque
+
+from report import Report
+
+# Priority tiers, most urgent first
+TIERS = ("urgent", "high", "normal", "low")
+
+# Tier for each report category (see Report.CATEGORIES); auto-flags are "automated"
+CATEGORY_TIERS = {
+    "immediate threat": "urgent",
+    "harassment": "high",
+    "inappropriate content": "high",
+    "fraud": "normal",
+    "disinformation": "normal",
+    "automated": "normal",
+    "spam": "low",
+}
+
+# Subtypes that rank above their category's tier
+SUBTYPE_TIERS = {
+    "sexual - minor": "urgent",
+    "doxxing": "urgent",
+    "stalking": "high",
+    "phishing": "high",
+    "malware": "high",
+}
+
+
+def tier_for(record):
+    '''
+    Most urgent tier among the report's subtype, its category, the category that subtype belongs to (auto-flags
+    from the text scorer carry a subtype but are filed as "automated") and every category reporters picked.
+    '''
+    tiers = [SUBTYPE_TIERS.get(record.subtype, "low"), CATEGORY_TIERS.get(record.category, "normal"),
+             CATEGORY_TIERS.get(Report.SUBTYPE_CATEGORY.get(record.subtype), "low")]
+    tiers.extend(CATEGORY_TIERS.get(category, "normal") for category in (record.categories or {}))
+    return min(tiers, key=TIERS.index)
+
+
+def priority_for(record):
+    '''
+    Ranking within the queue, higher first: the tier dominates, then classifier confidence, then the number of
+    people who reported the message (log-scaled, so a brigade of spam reports never outranks a tier above it).
+    '''
+    rank = len(TIERS) - 1 - TIERS.index(tier_for(record))
+    reporters = min(math.log2(record.reporter_count or 1), 9.0)
+    return rank * 100 + (record.score or 0) * 50 + reporters * 5
+
+
+class ModerationQueue:
+    '''
+    Open reports waiting for a moderator, ranked by priority_for. Backed by a binary heap with lazy deletion:
+    reprioritising or claiming a report just bumps its version, and stale heap entries are skipped when they
+    surface. So push and `review next` (pop) are O(log n) amortised.
+
+    Also keeps latency-to-first-review, per tier, over the last `window` reports that got a reviewer.
+    '''
+
+    def __init__(self, window=1000):
+        self.heap = [] # (-priority, created, report_id, version)
+        self.live = {} # report_id -> (version, tier, priority, created) for every report in the queue
+        self.claimed = set() # report_ids someone is reviewing right now
+        self.version = 0
+        self.latencies = {tier: deque(maxlen=window) for tier in TIERS} # seconds from filing to first review
+        self.stats = Counter()
+
+    def __len__(self):
+        return len(self.live) - len(self.claimed)
+
+    def push(self, record):
+        '''Adds a report, or re-ranks it if it's already queued (e.g. after another report was folded into it).'''
+        self.version += 1
+        entry = self.live[record.report_id] = (self.version, tier_for(record), priority_for(record), record.created or 0)
+        if record.report_id not in self.claimed:
+            heapq.heappush(self.heap, (-entry[2], entry[3], record.report_id, entry[0]))
+        if len(self.heap) > 2 * len(self.live) + 64:
+            self.compact()
+
+    def compact(self):
+        # Drop the stale entries that piled up from re-ranking and reports reviewed without `review next`
+        self.heap = [(-priority, created, report_id, version)
+                     for report_id, (version, _, priority, created) in self.live.items() if report_id not in self.claimed]
+        heapq.heapify(self.heap)
+
+    def pop_next(self):
+        '''Claims and returns the ID of the highest-priority unclaimed report, or None if there are none.'''
+        while self.heap:
+            _, _, report_id, version = heapq.heappop(self.heap)
+            entry = self.live.get(report_id)
+            if entry is None or entry[0] != version or report_id in self.claimed:
+                self.stats['stale'] += 1
+                continue
+            self.claimed.add(report_id)
+            return report_id
+        return None
+
+    def claim(self, report_id):
+        # Its heap entry stays where it is and is skipped when popped
+        if report_id in self.live:
+            self.claimed.add(report_id)
+
+    def release(self, record):
+        '''Puts a claimed report back in the queue, e.g. when the review is cancelled or abandoned.'''
+        self.claimed.discard(record.report_id)
+        if record.report_id in self.live:
+            self.push(record)
+
+    def done(self, report_id):
+        self.live.pop(report_id, None)
+        self.claimed.discard(report_id)
+
+    def record_first_review(self, record):
+        self.latencies[tier_for(record)].append(time.time() - (record.created or time.time()))
+
+    def pending_by_tier(self):
+        counts = Counter(entry[1] for report_id, entry in self.live.items() if report_id not in self.claimed)
+        return {tier: counts[tier] for tier in TIERS}
+
+    def latency_summary(self):
+        '''Tier -> (reviews counted, p50 seconds, p90 seconds), for tiers with at least one review.'''
+        summary = {}
+        for tier, latencies in self.latencies.items():
+            if latencies:
+                ordered = sorted(latencies)
+                summary[tier] = (len(ordered), ordered[len(ordered) // 2], ordered[int(len(ordered) * 0.9)])
+        return summary
@@ -1,7 +1,9 @@
 from enum import Enum, auto
 import discord
 import re
+import sys
 import asyncio
+from instrumentation import metrics
 
 
 class State(Enum):
@@ -29,11 +31,25 @@ class Report:
         "immediate threat": ["suicidal intent", "self-harm intent", "violence towards others", "violence towards me"]
     }
 
+    # Numbered menus built once here instead of per session, e.g. CATEGORY_MAP["1"] == "harassment"
+    CATEGORY_MAP = {str(i + 1): cat for i, cat in enumerate(CATEGORIES)}
+    CATEGORY_LIST = "\n".join([f"{i + 1}. {cat}" for i, cat in enumerate(CATEGORIES)])
+    SUBTYPE_MAPS = {cat: {str(i + 1): sub for i, sub in enumerate(subs)} for cat, subs in CATEGORIES.items()}
+    SUBTYPE_LISTS = {cat: "\n".join([f"{i + 1}. {sub}" for i, sub in enumerate(subs)]) for cat, subs in CATEGORIES.items()}
+    # Subtype names are unique across categories, e.g. SUBTYPE_CATEGORY["phishing"] == "fraud"
+    SUBTYPE_CATEGORY = {sub: cat for cat, subs in CATEGORIES.items() for sub in subs}
+
+    __slots__ = ("state", "client", "message_author_id", "message_author", "message_content", "type_selected",
+                 "subtype_selected", "q1_response", "q2_response", "block_response", "author_id", "guild_id",
+                 "channel_id", "message_id", "report_id")
+
     def __init__(self, client):
         self.state = State.REPORT_START
         self.client = client
-        self.message = None
-        self.reported_message = None
+        # We hold on to the reported message's IDs and the text we show mods, not the discord.Message itself
+        self.message_author_id = None
+        self.message_author = None
+        self.message_content = None
         self.type_selected = None
         self.subtype_selected = None
         self.q1_response = None
@@ -41,7 +57,11 @@ class Report:
         self.block_response = None
         self.author_id = None
         self.guild_id = None
+        self.channel_id = None
+        self.message_id = None
+        self.report_id = None
 
+    @metrics.timed("report_step", labels=lambda self, message: {"state": self.state.name})
     async def handle_message(self, message):
         '''
         This function makes up the meat of the user-side reporting flow. It defines how we transition between states and what 
@@ -64,50 +84,38 @@ class Report:
         if self.state == State.AWAITING_MESSAGE:
             # Parse out the three ID strings from the message link
             m = re.search('/(\d+)/(\d+)/(\d+)', message.content)
-            print(m)
             if not m:
                 return ["I'm sorry, I couldn't read that link. Please try again or say `cancel` to cancel."]
-            guild = self.client.get_guild(int(m.group(1)))
-            if not guild:
+            if not self.client.serves_guild(int(m.group(1))):
                 return ["I cannot accept reports of messages from guilds that I'm not in. Please have the guild owner add me to the guild and try again."]
-            channel = guild.get_channel(int(m.group(2)))
+            channel = self.client.resolve_channel(int(m.group(1)), int(m.group(2)))
             if not channel:
                 return ["It seems this channel was deleted or never existed. Please try again or say `cancel` to cancel."]
             try:
-                fetched_message = await channel.fetch_message(int(m.group(3)))
-                self.message = fetched_message
-                self.reported_message = fetched_message
-                self.guild_id = guild.id
-                print(self.reported_message)
-                print(type(self.reported_message))
+                # Shared, cached lookup: a message reported by many users is only fetched once
+                fetched_message = await self.client.messages.fetch(channel, int(m.group(3)))
+                self.set_message(fetched_message)
                
             except discord.errors.NotFound:
                 return ["It seems this message was deleted or never existed. Please try again or say `cancel` to cancel."]
 
             # Here we've found the message - it's up to you to decide what to do next!
-            # Build numbered list of categories
-            categories = list(self.CATEGORIES.keys())
-            self.category_map = {str(i + 1): cat for i, cat in enumerate(categories)}  # e.g., "1": "harassment"
-            numbered_list = "\n".join([f"{i + 1}. {cat}" for i, cat in enumerate(categories)])
-
             self.state = State.MESSAGE_IDENTIFIED
             return [
                 "Thank you for taking the time to keep our community safe.",
                 f"I found this message:",
                 f"```{message.author.name}: {message.content}```",
-                "Why are you reporting this post?\n" + numbered_list,
+                "Why are you reporting this post?\n" + self.CATEGORY_LIST,
                 "Please respond with the number of the category."
             ]
 
 
         if self.state == State.MESSAGE_IDENTIFIED:
             input_text = message.content.strip()
-            if input_text in self.category_map:
-                self.type_selected = self.category_map[input_text]
+            if input_text in self.CATEGORY_MAP:
+                self.type_selected = self.CATEGORY_MAP[input_text]
                 self.state = State.TYPE_SELECTED
-                subtypes = self.CATEGORIES[self.type_selected]
-                self.subtype_map = {str(i+1): sub for i, sub in enumerate(subtypes)}
-                numbered_options = "\n".join([f"{i+1}. {sub}" for i, sub in enumerate(subtypes)])
+                numbered_options = self.SUBTYPE_LISTS[self.type_selected]
                 return [
                     f"We're sorry that you're experiencing this kind of content on our platform. We'll do our best to help.",
                     f"What type of {self.type_selected} are you reporting?\n{numbered_options}",
@@ -120,8 +128,9 @@ class Report:
         
         if self.state == State.TYPE_SELECTED:
             input_text = message.content.strip()
-            if input_text in self.subtype_map:
-                self.subtype_selected = self.subtype_map[input_text]
+            subtype_map = self.SUBTYPE_MAPS[self.type_selected]
+            if input_text in subtype_map:
+                self.subtype_selected = subtype_map[input_text]
                 self.state = State.SUBTYPE_SELECTED
                 return ["Thank you for reporting this post. Would you like to answer more questions that will help us resolve this more quickly? (yes/no)"]
             else:
@@ -170,3 +179,100 @@ class Report:
     async def report_complete(self, response):
         self.state = State.REPORT_COMPLETE
         return [response]
+
+
+    def set_message(self, message):
+        # Messages fetched through a PartialMessageable (another shard's guild) have no cached guild
+        self.guild_id = message.guild.id if message.guild else message.channel.guild_id
+        self.channel_id = message.channel.id
+        self.message_id = message.id
+        self.message_author_id = message.author.id
+        self.message_author = message.author.name
+        self.message_content = message.content
+
+    def to_record(self):
+        '''Snapshot of the report for the flagged store: IDs and the bits of the reported message mods see.'''
+        return ReportRecord(
+            author_id=self.author_id,
+            guild_id=self.guild_id,
+            channel_id=self.channel_id,
+            message_id=self.message_id,
+            message_author_id=self.message_author_id,
+            message_author=self.message_author,
+            message_content=self.message_content,
+            category=self.type_selected,
+            subtype=self.subtype_selected,
+            q1_response=self.q1_response,
+            block_response=self.block_response,
+            reporter_count=1,
+            # auto-flags have no reporter; their author_id is the flagged message's author
+            reporter_ids=[self.author_id] if self.type_selected != "automated" else [],
+            categories={self.type_selected: 1},
+        )
+
+    @classmethod
+    def from_record(cls, client, record):
+        '''Rebuilds a completed report from a stored record.'''
+        report = cls(client)
+        report.state = State.REPORT_COMPLETE
+        report.report_id = record.report_id
+        report.author_id = record.author_id
+        report.guild_id = record.guild_id
+        report.channel_id = record.channel_id
+        report.message_id = record.message_id
+        report.message_author_id = record.message_author_id
+        report.message_author = record.message_author
+        report.message_content = record.message_content
+        report.type_selected = record.category
+        report.subtype_selected = record.subtype
+        report.q1_response = record.q1_response
+        report.block_response = record.block_response
+        return report
+
+
+class ReportRecord:
+    '''
+    The persisted part of a report, as held by the flagged store. Slotted, with the low-cardinality strings
+    (category, subtype, status, yes/no answers) interned, since the store keeps thousands of these around.
+    '''
+    __slots__ = ("report_id", "status", "created", "author_id", "guild_id", "channel_id", "message_id",
+                 "message_author_id", "message_author", "message_content", "category", "subtype",
+                 "q1_response", "block_response", "score", "reviewer_id", "q1_review", "q2_review",
+                 "mod_message_id", "attachment_scores", "reporter_count", "reporter_ids", "categories",
+                 "first_reviewed")
+
+    INTERNED = ("status", "category", "subtype", "q1_response", "block_response", "q1_review", "q2_review")
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def to_dict(self):
+        # Unset fields are left out to keep the stored JSON small
+        return {name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+
+    def fold(self, other):
+        '''
+        Merges another report against the same message into this one: bumps the reporter count and category
+        histogram and keeps the highest classifier score. Returns False (and changes nothing) if it's a repeat
+        report from someone who already reported this message.
+        '''
+        reporter_ids = self.reporter_ids or []
+        if other.reporter_ids and all(r in reporter_ids for r in other.reporter_ids):
+            return False
+        self.reporter_ids = reporter_ids + (other.reporter_ids or [])
+        self.reporter_count = (self.reporter_count or 1) + 1
+        categories = dict(self.categories or {})
+        categories[other.category] = categories.get(other.category, 0) + 1
+        self.categories = categories
+        if other.score is not None and other.score > (self.score or 0):
+            self.score = other.score
+            self.attachment_scores = other.attachment_scores
+        return True
+
+    @classmethod
+    def from_dict(cls, data):
+        for name in cls.INTERNED:
+            if isinstance(data.get(name), str):
+                data[name] = sys.intern(data[name])
+        return cls(**data)
@@ -0,0 +1,60 @@
+# resolver.py
+import asyncio
+import time
+from collections import Counter, OrderedDict
+
+
+class MessageResolver:
+    '''
+    Shared cache of fetched messages keyed by (channel_id, message_id). When a message goes viral and
+    many users report it, it is fetched from Discord once: later lookups come from the cache, and lookups that
+    arrive while the fetch is still in flight wait on that same fetch.
+
+    Entries expire after ttl seconds, the least recently used are evicted past max_entries, and the bot drops
+    an entry as soon as Discord tells us the message was edited or deleted.
+    '''
+
+    def __init__(self, max_entries=5000, ttl=10 * 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict() # key -> (message, time fetched)
+        self.inflight = {} # key -> task fetching that message
+        self.stats = Counter()
+
+    async def fetch(self, channel, message_id):
+        '''Like channel.fetch_message, including raising discord.errors.NotFound, but cached and coalesced.'''
+        # Channel IDs are unique across guilds, and a PartialMessageable (see ModBot.resolve_channel) has no guild
+        key = (channel.id, message_id)
+        entry = self.entries.get(key)
+        if entry is not None and time.monotonic() - entry[1] <= self.ttl:
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[0]
+
+        task = self.inflight.get(key)
+        if task is not None:
+            self.stats['coalesced'] += 1
+        else:
+            self.stats['misses'] += 1
+            task = self.inflight[key] = asyncio.create_task(channel.fetch_message(message_id))
+            task.add_done_callback(lambda t: self.fetched(key, t))
+        return await asyncio.shield(task)
+
+    def fetched(self, key, task):
+        if task.cancelled() or task.exception() is not None or self.inflight.get(key) is not task:
+            # failed, or invalidated while in flight
+            if self.inflight.get(key) is task:
+                del self.inflight[key]
+            return
+        del self.inflight[key]
+        self.entries[key] = (task.result(), time.monotonic())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, guild_id, channel_id, message_id):
+        key = (channel_id, message_id)
+        if self.entries.pop(key, None) is not None:
+            self.stats['invalidated'] += 1
+        # A fetch that started before the edit/delete would cache stale data, so don't let it
+        self.inflight.pop(key, None)
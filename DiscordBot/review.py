@@ -2,6 +2,8 @@ from enum import Enum, auto
 import discord
 import re
 import asyncio
+from report import Report
+from instrumentation import metrics
 
 
 '''
@@ -27,18 +29,29 @@ class Review:
     CANCEL_KEYWORD = "cancel"
     HELP_KEYWORD = "help"
 
+    __slots__ = ("state", "client", "report", "guild_id", "channel_id", "message_id", "type_selected",
+                 "subtype_selected", "q1_response", "q2_response", "block_response", "classification",
+                 "ai_confidence", "image_mislead", "cancelled")
+
     def __init__(self, client, report):
         self.state = ReviewState.REVIEW_START
         self.client = client
         self.report = report
-        self.message = report.message
-        self.reported_message = None
+        # IDs of the reported message; it's only fetched if the moderator decides to delete it
+        self.guild_id = report.guild_id
+        self.channel_id = report.channel_id
+        self.message_id = report.message_id
         self.type_selected = report.type_selected
         self.subtype_selected = report.subtype_selected
         self.q1_response = None
         self.q2_response = None
         self.block_response = None
+        self.classification = None
+        self.ai_confidence = None
+        self.image_mislead = None
+        self.cancelled = False # the moderator gave up before answering, so the report is still unreviewed
 
+    @metrics.timed("review_step", labels=lambda self, message: {"state": self.state.name})
     async def handle_message(self, message):
         '''
         This function makes up the meat of the moderator review flow. It defines how we transition between states and what 
@@ -47,6 +60,7 @@ class Review:
 
         if message.content == self.CANCEL_KEYWORD:
             self.state = ReviewState.REVIEW_COMPLETE
+            self.cancelled = True
             return ["Review cancelled."]
         
         if self.report and self.state == ReviewState.REVIEW_START:
@@ -72,7 +86,8 @@ class Review:
             ]
         
         if self.state == ReviewState.AWAITING_CLASSIFICATION_CONFIRMATION:
-            self.q1_response = message.content
+            if message.content in ('yes', 'no'):
+                self.q1_response = message.content
             if message.content == 'yes':
                 self.state = ReviewState.AWAITING_REMOVAL_RECOMMENDATION
                 return [
@@ -90,9 +105,7 @@ class Review:
         if self.state == ReviewState.AWAITING_VIOLATION_CONFIRMATION:
             if message.content == 'yes':
                 # ask to reclassify
-                cats = list(self.CATEGORIES.keys())
-                self.category_map = {str(i+1): c for i,c in enumerate(cats)}
-                numbered = '\n'.join([f"{i+1}. {c}" for i,c in enumerate(cats)])
+                numbered = Report.CATEGORY_LIST
                 self.state = ReviewState.AWAITING_CLASSIFY_TYPE
                 return [
                     "Please classify this post's abuse type:", numbered,
@@ -104,7 +117,8 @@ class Review:
             return ["Please respond with `yes` or `no`. "]
         # 4b) If classification accurate → removal recommendation
         if self.state == ReviewState.AWAITING_REMOVAL_RECOMMENDATION:
-            self.q2_response = message.content
+            if message.content in ('yes', 'no'):
+                self.q2_response = message.content
             if message.content == 'yes':
                 self.state = ReviewState.AWAITING_USER_REMOVAL
                 return [
@@ -142,11 +156,9 @@ class Review:
         
         # 7) Reclassification flow: choose category
         if self.state == ReviewState.AWAITING_CLASSIFY_TYPE:
-            if message.content in self.category_map:
-                self.classification = self.category_map[message.content]
-                subs = self.CATEGORIES[self.classification]
-                self.subtype_map = {str(i+1): s for i,s in enumerate(subs)}
-                numbered = '\n'.join([f"{i+1}. {s}" for i,s in enumerate(subs)])
+            if message.content in Report.CATEGORY_MAP:
+                self.classification = Report.CATEGORY_MAP[message.content]
+                numbered = Report.SUBTYPE_LISTS[self.classification]
                 self.state = ReviewState.AWAITING_SUBTYPE
                 return [
                     f"Selected type: {self.classification}.",
@@ -157,8 +169,9 @@ class Review:
         
         # 8) Subtype selection
         if self.state == ReviewState.AWAITING_SUBTYPE:
-            if message.content in self.subtype_map:
-                self.subtype_selected = self.subtype_map[message.content]
+            subtype_map = Report.SUBTYPE_MAPS[self.classification]
+            if message.content in subtype_map:
+                self.subtype_selected = subtype_map[message.content]
                 self.state = ReviewState.AWAITING_AI_CHECK
                 return [
                     "Our system finds there's a __% chance the image was AI-generated or altered.",
@@ -0,0 +1,93 @@
+# routing.py
+import logging
+
+logger = logging.getLogger('discord')
+
+# What the bot does with a guild message, by the channel it was sent in
+MONITORED = "monitored" # scanned and auto-flagged
+MOD = "mod" # moderator commands and reviews
+
+
+class ChannelRouter:
+    '''
+    Map from channel IDs to what the bot does with messages sent there, so on_message dispatches with one dict
+    lookup instead of comparing channel names. Channels are matched by name (see configure) when a guild is
+    indexed and kept current from the guild and channel create/update/delete events, so renamed, new and deleted
+    channels are picked up without a restart. Any number of channels per guild can be monitored.
+
+    Each guild has at most one mod channel in use, the first one found; if it goes away, another channel with the
+    mod name takes over. If given, on_mod_channel(guild_id, channel or None) is called whenever that changes.
+    '''
+
+    def __init__(self, on_mod_channel=None):
+        self.on_mod_channel = on_mod_channel
+        self.names = {} # channel name -> MONITORED or MOD
+        self.routes = {} # channel ID -> MONITORED or MOD; anything else is ignored
+        self.guild_channels = {} # guild ID -> IDs of its routed channels
+        self.mod_candidates = {} # guild ID -> {channel ID: channel} of channels with the mod name, in order found
+        self.mod_channels = {} # guild ID -> the mod channel in use
+
+    def configure(self, names, guilds):
+        '''Sets the channel names to route (name -> MONITORED or MOD) and re-indexes every guild.'''
+        self.names = dict(names)
+        self.routes.clear()
+        self.guild_channels.clear()
+        self.mod_candidates.clear()
+        for guild in guilds:
+            self.add_guild(guild)
+        # Guilds we are no longer in lose their mod channel too
+        for guild_id in set(self.mod_channels) - set(self.mod_candidates):
+            self.pick_mod_channel(guild_id)
+        logger.info(f"Routing {len(self.routes)} channel(s) across {len(self.guild_channels)} guild(s)")
+
+    def route(self, channel_id):
+        return self.routes.get(channel_id)
+
+    def add_guild(self, guild):
+        for channel in guild.text_channels:
+            self.update(channel)
+
+    def remove_guild(self, guild_id):
+        for channel_id in self.guild_channels.pop(guild_id, ()):
+            self.routes.pop(channel_id, None)
+        self.mod_candidates.pop(guild_id, None)
+        self.pick_mod_channel(guild_id)
+
+    def update(self, channel):
+        '''Routes a new or changed text channel by its current name, or stops routing it if the name no longer matches.'''
+        kind = self.names.get(channel.name)
+        if kind is None:
+            self.remove(channel)
+            return
+        guild_id = channel.guild.id
+        self.routes[channel.id] = kind
+        self.guild_channels.setdefault(guild_id, set()).add(channel.id)
+        candidates = self.mod_candidates.setdefault(guild_id, {})
+        if kind == MOD:
+            candidates[channel.id] = channel
+        elif candidates.pop(channel.id, None) is None:
+            return
+        self.pick_mod_channel(guild_id)
+
+    def remove(self, channel):
+        if self.routes.pop(channel.id, None) is None:
+            return
+        guild_id = channel.guild.id
+        self.guild_channels.get(guild_id, set()).discard(channel.id)
+        if self.mod_candidates.get(guild_id, {}).pop(channel.id, None) is not None:
+            self.pick_mod_channel(guild_id)
+
+    def pick_mod_channel(self, guild_id):
+        current = self.mod_channels.get(guild_id)
+        candidates = self.mod_candidates.get(guild_id) or {}
+        if current is not None and current.id in candidates:
+            # Keep the one in use, but pick up the updated channel object (e.g. after a permission change)
+            self.mod_channels[guild_id] = candidates[current.id]
+            return
+        chosen = next(iter(candidates.values()), None)
+        if chosen is None:
+            self.mod_channels.pop(guild_id, None)
+        else:
+            self.mod_channels[guild_id] = chosen
+        if chosen is not current and self.on_mod_channel:
+            self.on_mod_channel(guild_id, chosen)
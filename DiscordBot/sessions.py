@@ -0,0 +1,89 @@
+# sessions.py
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger('discord')
+
+
+class SessionManager:
+    '''
+    Map from user IDs to their in-progress Report or Review. Behaves like the plain dicts it replaces, but a
+    session that hasn't been touched for idle_timeout seconds is dropped by a periodic sweeper, and once
+    max_sessions are live the least recently used one is evicted to make room.
+
+    Sessions are kept in last-touched order, so a sweep only looks at the ones that actually expired.
+    If given, on_drop(user_id, session) is called for every session expired or evicted this way.
+    '''
+
+    def __init__(self, name, idle_timeout=15 * 60, max_sessions=10000, sweep_interval=60, on_drop=None):
+        self.name = name
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.sweep_interval = sweep_interval
+        self.on_drop = on_drop
+
+        self.sessions = OrderedDict() # user_id -> (session, last touched)
+        self.sweep_task = None
+        self.stats = Counter()
+
+    def __len__(self):
+        # Gauge of live sessions
+        return len(self.sessions)
+
+    def __contains__(self, user_id):
+        return user_id in self.sessions
+
+    def __getitem__(self, user_id):
+        session, _ = self.sessions[user_id]
+        self.sessions[user_id] = (session, time.monotonic())
+        self.sessions.move_to_end(user_id)
+        return session
+
+    def __setitem__(self, user_id, session):
+        self.sessions[user_id] = (session, time.monotonic())
+        self.sessions.move_to_end(user_id)
+        while len(self.sessions) > self.max_sessions:
+            evicted, (dropped, _) = self.sessions.popitem(last=False)
+            self.stats['evicted'] += 1
+            logger.info(f"Evicted {self.name} session for user {evicted}: too many live sessions")
+            if self.on_drop:
+                self.on_drop(evicted, dropped)
+
+    def __delitem__(self, user_id):
+        del self.sessions[user_id]
+
+    def get(self, user_id, default=None):
+        return self[user_id] if user_id in self.sessions else default
+
+    def pop(self, user_id, *default):
+        if user_id not in self.sessions and default:
+            return default[0]
+        return self.sessions.pop(user_id)[0]
+
+    def sweep(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        while self.sessions:
+            user_id, (session, touched) = next(iter(self.sessions.items()))
+            if touched > cutoff:
+                break
+            del self.sessions[user_id]
+            self.stats['expired'] += 1
+            logger.info(f"Expired idle {self.name} session for user {user_id}")
+            if self.on_drop:
+                self.on_drop(user_id, session)
+
+    def start(self):
+        if self.sweep_task is None:
+            self.sweep_task = asyncio.create_task(self.sweep_loop())
+
+    def stop(self):
+        if self.sweep_task is not None:
+            self.sweep_task.cancel()
+            self.sweep_task = None
+
+    async def sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.sweep()
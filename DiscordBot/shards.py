@@ -0,0 +1,162 @@
+# shards.py
+'''
+Runs ModBot as several processes on one machine, for when one process and one event loop can't keep up:
+
+    python shards.py --shards 4 --processes 2 --classifier-workers 2
+
+Each shard process runs discord.py's AutoShardedClient for its share of the shards (shard i goes to process
+i % processes), so the gateway load is spread across cores. Shard processes only download and triage images;
+everything CPU-heavy after that (hashing, decoding and resizing, the verdict cache) and the Vertex call happen
+in separate classifier worker processes, which get the image bytes over local HTTP. Reports, reviews and mod
+channels live in the shared SQLite store (reports.db), so `review <id>` works from any shard, `review next`
+never hands one report to moderators on two shards (the claim is recorded there), and DMs, which Discord
+delivers to shard 0 only, can be filed against guilds another process serves.
+'''
+import argparse
+import asyncio
+import itertools
+import logging
+import multiprocessing
+
+import aiohttp
+import discord
+from aiohttp import web
+
+import bot
+from bot import ModBot, load_tokens, start_logging
+from cache import VerdictCache
+from classifier import ImageClassifier
+
+logger = logging.getLogger('discord')
+
+
+class ShardedModBot(ModBot, discord.AutoShardedClient):
+    '''ModBot on discord.py's AutoShardedClient: one gateway connection per shard in shard_ids.'''
+
+
+class RemoteScorer:
+    '''
+    Scores images for a shard process's ImageClassifier by posting the downloaded bytes to the next classifier
+    worker, round robin. Returns the worker's confidence, or None if it couldn't score the image.
+    '''
+
+    def __init__(self, urls, timeout=30):
+        self.urls = itertools.cycle(urls)
+        self.timeout = timeout
+        self.session = None
+
+    async def score(self, data):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        url = next(self.urls)
+        try:
+            async with self.session.post(url, data=data, headers={"Content-Type": "application/octet-stream"}) as response:
+                if response.status != 200:
+                    logger.warning(f"Classifier worker {url} failed to score an image. Status code: {response.status}")
+                    return None
+                return (await response.json())["confidence"]
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Error sending an image to classifier worker {url}: {e}")
+            return None
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+
+def serve_classifier(port, google_credentials):
+    '''
+    Classifier worker process: scores the images shard processes post to /score, with the same ImageClassifier
+    stages a single-process bot runs after triage. Its verdict cache and prediction batches are shared by every
+    shard that sends images here.
+    '''
+    listener = start_logging(tag=f"classifier{port}")
+    try:
+        asyncio.run(run_classifier(port, google_credentials))
+    finally:
+        listener.stop()
+
+
+async def run_classifier(port, google_credentials):
+    verdicts = VerdictCache(max_entries=bot.verdict_cache_size, ttl=bot.verdict_cache_ttl,
+                            path=bot.verdict_cache_path, perceptual=bot.verdict_cache_perceptual)
+    classifier = ImageClassifier(google_credentials, google_credentials['project_id'], bot.region, bot.endpoint_id,
+                                 max_concurrency=bot.classifier_concurrency, timeout=bot.classifier_timeout,
+                                 max_batch_size=bot.classifier_batch_size, max_batch_wait=bot.classifier_batch_wait,
+                                 cache=verdicts, max_download_bytes=bot.classifier_max_download)
+    await classifier.warm_up()
+
+    async def score(request):
+        data = await request.read()
+        try:
+            confidence = await asyncio.wait_for(classifier.classify_bytes(data), timeout=classifier.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timed out after {classifier.timeout}s scoring an image in classifier worker on port {port}")
+            confidence = None
+        except Exception as e:
+            logger.error(f"Error scoring an image in classifier worker on port {port}: {e}")
+            return web.json_response({"error": str(e)}, status=502)
+        return web.json_response({"confidence": confidence})
+
+    app = web.Application(client_max_size=bot.classifier_max_download)
+    app.router.add_post("/score", score)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await classifier.close()
+
+
+def run_shards(index, shard_ids, shard_count, worker_urls):
+    # Rotating handlers can't share a file between processes, so each one logs to its own
+    listener = start_logging(tag=f"shard{index}")
+    try:
+        tokens = load_tokens()
+        client = ShardedModBot(tokens['google'], worker_id=index, shared_store=True,
+                               scorer=RemoteScorer(worker_urls) if worker_urls else None,
+                               shard_ids=shard_ids, shard_count=shard_count)
+        client.run(tokens['discord'], log_handler=None)
+    finally:
+        listener.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, default=2, help="total gateway shards")
+    parser.add_argument("--processes", type=int, default=2, help="shard processes to spread the shards over")
+    parser.add_argument("--classifier-workers", type=int, default=1,
+                        help="classifier worker processes (0: each shard process scores its own images)")
+    parser.add_argument("--worker-port", type=int, default=9300, help="port of the first classifier worker")
+    args = parser.parse_args()
+    if not 1 <= args.processes <= args.shards:
+        parser.error("need at least one shard per process")
+
+    tokens = load_tokens()
+    # spawn rather than fork: the children start their own event loops and threads
+    context = multiprocessing.get_context("spawn")
+    worker_urls = [f"http://127.0.0.1:{args.worker_port + i}/score" for i in range(args.classifier_workers)]
+    processes = [context.Process(target=serve_classifier, args=(args.worker_port + i, tokens['google']),
+                                 name=f"classifier-{i}") for i in range(args.classifier_workers)]
+    for index in range(args.processes):
+        shard_ids = list(range(index, args.shards, args.processes))
+        processes.append(context.Process(target=run_shards, args=(index, shard_ids, args.shards, worker_urls),
+                                         name=f"shards-{index}"))
+
+    for process in processes:
+        process.start()
+        print(f"Started {process.name} (pid {process.pid})")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
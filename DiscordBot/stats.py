@@ -0,0 +1,176 @@
+# stats.py
+import asyncio
+import json
+import logging
+import time
+from collections import Counter, deque
+
+import discord
+
+logger = logging.getLogger('discord')
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else None
+
+
+class ScanStats:
+    '''
+    Rolling counts for the group channel scanner: messages scanned and flagged per guild, classifier latency and
+    verdict cache hit rate, over roughly the last `window` seconds (kept in one-minute buckets). Replaces posting
+    every evaluated message to the mod channel; the bot publishes a summary embed from this instead.
+    '''
+    BUCKET = 60
+
+    def __init__(self, cache=None, window=15 * 60, max_samples=10000):
+        self.cache = cache
+        self.window = window
+        self.buckets = deque() # (bucket start, Counter of (guild_id, name), cache (hits, lookups) at bucket start)
+        self.latencies = deque(maxlen=max_samples) # (time, seconds) for each image the classifier scored
+        self.totals = Counter() # since startup
+
+    def cache_mark(self):
+        if self.cache is None:
+            return (0, 0)
+        stats = self.cache.stats
+        return (stats['hits'] + stats['perceptual_hits'] + stats['coalesced'], stats['hits'] + stats['misses'])
+
+    def bucket(self):
+        now = time.time()
+        start = now - now % self.BUCKET
+        if not self.buckets or self.buckets[-1][0] != start:
+            self.buckets.append((start, Counter(), self.cache_mark()))
+            while self.buckets[0][0] < now - self.window - self.BUCKET:
+                self.buckets.popleft()
+        return self.buckets[-1][1]
+
+    def record_message(self, guild_id, flagged=False, degraded=False):
+        counts = self.bucket()
+        counts[(guild_id, 'scanned')] += 1
+        self.totals['scanned'] += 1
+        if degraded:
+            # shed by admission control: only the cheap checks ran
+            counts[(guild_id, 'degraded')] += 1
+            self.totals['degraded'] += 1
+        if flagged:
+            counts[(guild_id, 'flagged')] += 1
+            self.totals['flagged'] += 1
+
+    def record_unchecked(self, guild_id):
+        # shed by admission control with even the cheap checks backed up: not looked at at all
+        self.bucket()[(guild_id, 'unchecked')] += 1
+        self.totals['unchecked'] += 1
+
+    def record_classifier(self, seconds):
+        self.latencies.append((time.time(), seconds))
+        self.totals['classifier_calls'] += 1
+
+    def snapshot(self, guild_id=None):
+        '''Window totals for one guild, or all of them if guild_id is None.'''
+        self.bucket()
+        counts = Counter()
+        for _, bucket, _ in self.buckets:
+            for (bucket_guild, name), n in bucket.items():
+                if guild_id is None or bucket_guild == guild_id:
+                    counts[name] += n
+
+        cutoff = time.time() - self.window
+        latencies = sorted(seconds for when, seconds in self.latencies if when >= cutoff)
+        hits, lookups = self.cache_mark()
+        old_hits, old_lookups = self.buckets[0][2]
+        lookups -= old_lookups
+        return {
+            "window": self.window,
+            "scanned": counts['scanned'],
+            "flagged": counts['flagged'],
+            "flag_rate": counts['flagged'] / counts['scanned'] if counts['scanned'] else 0.0,
+            "degraded": counts['degraded'],
+            "unchecked": counts['unchecked'],
+            "classifier_calls": len(latencies),
+            "classifier_p50": percentile(latencies, 0.5),
+            "classifier_p99": percentile(latencies, 0.99),
+            "cache_hit_rate": (hits - old_hits) / lookups if lookups else None,
+        }
+
+
+def summary_embed(snapshot):
+    def ms(seconds):
+        return f"{seconds * 1000:.0f} ms" if seconds is not None else "N/A"
+
+    embed = discord.Embed(
+        title="📊 Scanner Summary",
+        description=f"Last {snapshot['window'] // 60} minutes",
+        color=discord.Color.blurple()
+    )
+    embed.add_field(name="Messages Scanned", value=str(snapshot['scanned']), inline=True)
+    embed.add_field(name="Flagged", value=f"{snapshot['flagged']} ({snapshot['flag_rate']:.2%})", inline=True)
+    embed.add_field(name="Images Classified", value=str(snapshot['classifier_calls']), inline=True)
+    embed.add_field(name="Classifier Latency",
+                    value=f"p50 {ms(snapshot['classifier_p50'])}, p99 {ms(snapshot['classifier_p99'])}", inline=True)
+    hit_rate = snapshot['cache_hit_rate']
+    embed.add_field(name="Cache Hit Rate", value=f"{hit_rate:.2%}" if hit_rate is not None else "N/A", inline=True)
+    if snapshot['degraded']:
+        embed.add_field(name="⚠️ Load Shed",
+                        value=f"{snapshot['degraded']} message(s) got text and file name checks only, "
+                              f"no image scoring", inline=False)
+    if snapshot.get('unchecked'):
+        embed.add_field(name="⚠️ Not Checked",
+                        value=f"{snapshot['unchecked']} message(s) arrived too fast to check at all", inline=False)
+    return embed
+
+
+class StatsServer:
+    '''
+    Minimal HTTP endpoint for scraping the bot's counters locally. Only GET is supported; each path is served by
+    a render callable returning the response body as a string. Binds to localhost by default, since nothing here
+    is authenticated.
+    '''
+
+    def __init__(self, host='127.0.0.1', port=9108):
+        self.host = host
+        self.port = port
+        self.routes = {} # path -> (content type, render)
+        self.server = None
+
+    def route(self, path, content_type, render):
+        self.routes[path] = (content_type, render)
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        logger.info(f"Serving stats on http://{self.host}:{self.port}")
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Headers aren't used, but have to be read before answering
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+            parts = request.decode("latin-1").split()
+            path = parts[1].split("?", 1)[0] if len(parts) >= 2 else ""
+            if len(parts) < 2 or parts[0] != "GET":
+                status, content_type, body = "405 Method Not Allowed", "text/plain", "GET only\n"
+            elif path not in self.routes:
+                status, content_type, body = "404 Not Found", "text/plain", "not found\n"
+            else:
+                content_type, render = self.routes[path]
+                status, body = "200 OK", render()
+            payload = body.encode()
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n"
+                         f"Connection: close\r\n\r\n".encode() + payload)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"Error serving stats request: {e}")
+        finally:
+            writer.close()
+
+
+def render_json(data):
+    return json.dumps(data, indent=2, default=str) + "\n"
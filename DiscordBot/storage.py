@@ -0,0 +1,379 @@
+# storage.py
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from report import ReportRecord
+
+logger = logging.getLogger('discord')
+
+
+class SnowflakeGenerator:
+    '''
+    Report IDs in Discord's snowflake layout: milliseconds since the Discord epoch, then a 10-bit worker ID and a
+    12-bit sequence number. IDs are assigned locally, sort by creation time, and stay unique across processes as
+    long as each uses its own worker_id.
+    '''
+    EPOCH = 1420070400000
+
+    def __init__(self, worker_id=0):
+        self.worker_id = worker_id & 0x3FF
+        self.last_ms = -1
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def next_id(self):
+        with self.lock:
+            now = int(time.time() * 1000)
+            if now <= self.last_ms:
+                now = self.last_ms
+                self.sequence = (self.sequence + 1) & 0xFFF
+                if self.sequence == 0:
+                    # 4096 IDs in one millisecond: borrow the next one
+                    now += 1
+            else:
+                self.sequence = 0
+            self.last_ms = now
+            return ((now - self.EPOCH) << 22) | (self.worker_id << 12) | self.sequence
+
+
+class ReportStore:
+    '''
+    Flagged reports, keyed by report ID, kept in a SQLite database (WAL mode) so they survive restarts and
+    `review <id>` keeps working for anything filed before a crash.
+
+    Each report is stored as a compact JSON record (see ReportRecord) next to indexed columns for the fields
+    we search on: author, guild, category and status. Lookups check pending writes and a small LRU of recent
+    records before a primary-key read; writes are buffered and flushed in batches on a background thread so the
+    event loop never waits on the disk.
+
+    With shared=True several bot processes can use the same database file (see shards.py). Reads then go to the
+    database instead of the in-process LRU, since another process may have changed the row since, and writes
+    wait for each other's locks instead of failing. That waiting only ever happens on the writer thread: lookups
+    on the event loop are read-only and merge in what hasn't been written yet. Which moderator is reviewing a
+    report is kept in the database too (see claim), and every write is numbered so each process can pick up
+    what the others changed without rereading everything (see changes).
+    '''
+
+    COLUMNS = ("report_id", "author_id", "guild_id", "category", "status", "created", "data", "mod_message_id",
+               "message_id", "seq")
+    # Claims are left alone when a record is rewritten: another process may hold one on it
+    UPSERT = (f"INSERT INTO reports ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+              f"ON CONFLICT (report_id) DO UPDATE SET "
+              f"{', '.join(f'{column} = excluded.{column}' for column in COLUMNS[1:])}")
+
+    def __init__(self, path='reports.db', flush_interval=0.5, cache_size=1000, shared=False):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self.shared = shared
+
+        self.pending = {} # report_id -> record not yet written to disk
+        self.writing = {} # report_id -> record handed to the writer thread but not committed yet
+        self.recent = OrderedDict() # report_id -> record, most recently used last
+        self.open_by_message = {} # reported message ID -> ID of the open report aggregating it
+        self.flush_task = None
+        self.flush_lock = threading.Lock()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='report-store')
+
+        # WAL lets the reader connection (event loop) run alongside the writer connection (writer thread)
+        self.db = self.connect()
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS reports (
+                report_id INTEGER PRIMARY KEY,
+                author_id INTEGER,
+                guild_id INTEGER,
+                category TEXT,
+                status TEXT,
+                created REAL,
+                data TEXT,
+                mod_message_id INTEGER,
+                message_id INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS reports_author ON reports (author_id);
+            CREATE INDEX IF NOT EXISTS reports_guild ON reports (guild_id);
+            CREATE INDEX IF NOT EXISTS reports_category ON reports (category);
+            CREATE INDEX IF NOT EXISTS reports_status ON reports (status);
+            CREATE TABLE IF NOT EXISTS mod_channels (
+                guild_id INTEGER PRIMARY KEY,
+                channel_id INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS changes (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                seq INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO changes (id, seq) VALUES (0, 0);
+        ''')
+        # Columns added after the first version of the table
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(reports)")]
+        for column, kind in (("mod_message_id", "INTEGER"), ("message_id", "INTEGER"), ("claimed_by", "INTEGER"),
+                             ("claimed_at", "REAL"), ("seq", "INTEGER")):
+            if column not in columns:
+                self.db.execute(f"ALTER TABLE reports ADD COLUMN {column} {kind}")
+        self.db.execute("CREATE INDEX IF NOT EXISTS reports_mod_message ON reports (mod_message_id)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS reports_message ON reports (message_id, status)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS reports_seq ON reports (seq)")
+        self.db.commit()
+        self.write_db = self.connect()
+
+    def connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("PRAGMA busy_timeout=5000")
+        return db
+
+    def start(self):
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush_loop())
+
+    async def close(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.flush()
+        self.writer.shutdown(wait=True)
+        self.db.close()
+        self.write_db.close()
+
+    def add(self, report_id, record, status="open"):
+        record.report_id = report_id
+        record.status = status
+        if record.created is None:
+            record.created = time.time()
+        self.put(report_id, record)
+
+    def put(self, report_id, record):
+        self.pending[report_id] = record
+        self.remember(report_id, record)
+        if record.message_id is not None:
+            if record.status == "open":
+                self.open_by_message[record.message_id] = report_id
+            elif self.open_by_message.get(record.message_id) == report_id:
+                del self.open_by_message[record.message_id]
+
+    def get_open_for_message(self, message_id):
+        '''Returns the open report already filed against a reported message, or None.'''
+        if message_id is None:
+            return None
+        report_id = self.open_by_message.get(message_id)
+        if report_id is not None:
+            if not self.shared:
+                return self.get(report_id)
+            # Our own unwritten version is newer than anything in the database
+            record = self.pending.get(report_id) or self.writing.get(report_id)
+            if record is not None and record.status == "open":
+                return record
+        # Reports filed since startup are all in open_by_message, so this only finds ones from a previous run
+        # (or, when shared, ones filed by another process). Read-only, so it never waits on a writer's lock.
+        row = self.db.execute("SELECT report_id FROM reports WHERE message_id = ? AND status = 'open' "
+                              "ORDER BY created LIMIT 1", (message_id,)).fetchone()
+        if row is None:
+            return None
+        record = self.get(row[0])
+        if record is None or record.status != "open":
+            return None
+        self.open_by_message[message_id] = record.report_id
+        return record
+
+    def update(self, report_id, **fields):
+        record = self.get(report_id)
+        if record is None:
+            return None
+        for name, value in fields.items():
+            setattr(record, name, value)
+        self.put(report_id, record)
+        return record
+
+    def remember(self, report_id, record):
+        self.recent[report_id] = record
+        self.recent.move_to_end(report_id)
+        while len(self.recent) > self.cache_size:
+            self.recent.popitem(last=False)
+
+    def get(self, report_id):
+        '''Returns the record for report_id, or None.'''
+        record = self.pending.get(report_id) or self.writing.get(report_id)
+        if record is not None:
+            return record
+        record = None if self.shared else self.recent.get(report_id)
+        if record is not None:
+            self.recent.move_to_end(report_id)
+            return record
+
+        row = self.db.execute("SELECT data FROM reports WHERE report_id = ?", (report_id,)).fetchone()
+        if row is None:
+            return None
+        record = ReportRecord.from_dict(json.loads(row[0]))
+        self.remember(report_id, record)
+        return record
+
+    def set_mod_channel(self, guild_id, channel_id):
+        # Lets processes that don't serve a guild still post to its mod channel. Written on the writer thread,
+        # since with a shared database the write can wait on other processes' locks.
+        future = self.writer.submit(self.write_mod_channel, guild_id, channel_id)
+        future.add_done_callback(self.log_write_error)
+
+    def write_mod_channel(self, guild_id, channel_id):
+        with self.flush_lock, self.write_db:
+            self.write_db.execute("INSERT OR REPLACE INTO mod_channels (guild_id, channel_id) VALUES (?, ?)",
+                                  (guild_id, channel_id))
+
+    def log_write_error(self, future):
+        if future.exception() is not None:
+            logger.error(f"Error writing to {self.path}: {future.exception()}")
+
+    def get_mod_channel(self, guild_id):
+        row = self.db.execute("SELECT channel_id FROM mod_channels WHERE guild_id = ?", (guild_id,)).fetchone()
+        return row[0] if row else None
+
+    async def claim(self, report_id, moderator_id, ttl):
+        '''
+        Records moderator_id as reviewing an open report, unless another moderator claimed it less than ttl seconds
+        ago (a claim that old belongs to a process that went away). Returns whether the claim is ours. The check
+        and the write are a single statement, so two processes sharing the database can't both claim a report.
+        '''
+        record = self.unwritten().get(report_id)
+        row = self.row(report_id, record) if record is not None else None
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.writer, self.write_claim, report_id, moderator_id, ttl, row)
+
+    def write_claim(self, report_id, moderator_id, ttl, row):
+        now = time.time()
+        with self.flush_lock, self.write_db:
+            seq = self.next_seq()
+            if row is not None:
+                # Not flushed yet, and it has to be in the table to be claimed
+                self.write_db.execute(self.UPSERT, (*row, seq))
+            cursor = self.write_db.execute(
+                "UPDATE reports SET claimed_by = ?, claimed_at = ?, seq = ? WHERE report_id = ? AND status = 'open' "
+                "AND (claimed_by IS NULL OR claimed_by = ? OR claimed_at < ?)",
+                (moderator_id, now, seq, report_id, moderator_id, now - ttl)
+            )
+            return cursor.rowcount == 1
+
+    def release(self, report_id, moderator_id):
+        '''Gives up moderator_id's claim on a report, if they still hold it.'''
+        future = self.writer.submit(self.write_release, report_id, moderator_id)
+        future.add_done_callback(self.log_write_error)
+
+    def write_release(self, report_id, moderator_id):
+        with self.flush_lock, self.write_db:
+            self.write_db.execute(
+                "UPDATE reports SET claimed_by = NULL, claimed_at = NULL, seq = ? WHERE report_id = ? AND claimed_by = ?",
+                (self.next_seq(), report_id, moderator_id)
+            )
+
+    async def changes(self, since=0):
+        '''
+        Every report written, claimed or released since `since`, the seq returned by an earlier call, as
+        (seq, [(record, claimed_by, claimed_at)]). since=0 returns every open report instead. Writes are numbered
+        in commit order, whichever process made them, so passing the returned seq next time picks up exactly what
+        changed in between. Read (and decoded) on the writer thread, off the event loop.
+        '''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.writer, self.read_changes, since)
+
+    def read_changes(self, since):
+        if since:
+            rows = self.write_db.execute("SELECT data, claimed_by, claimed_at, seq FROM reports WHERE seq > ? "
+                                         "ORDER BY seq", (since,)).fetchall()
+            seq = rows[-1][3] if rows else since
+        else:
+            # Read first, so anything committed in between is returned again next time rather than missed
+            seq = self.write_db.execute("SELECT seq FROM changes").fetchone()[0]
+            rows = self.write_db.execute("SELECT data, claimed_by, claimed_at, seq FROM reports "
+                                         "WHERE status = 'open'").fetchall()
+        return seq, [(ReportRecord.from_dict(json.loads(data)), claimed_by, claimed_at)
+                     for data, claimed_by, claimed_at, _ in rows]
+
+    def next_seq(self):
+        # Inside a write transaction, so numbers are handed out in commit order across processes
+        self.write_db.execute("UPDATE changes SET seq = seq + 1")
+        return self.write_db.execute("SELECT seq FROM changes").fetchone()[0]
+
+    def unwritten(self):
+        # Records not yet committed, newest version of each
+        return {**self.writing, **self.pending}
+
+    def get_by_mod_message(self, mod_message_id):
+        '''
+        Returns the first record posted in the given mod channel message (an embed or a digest), or None.
+        Pending writes are included.
+        '''
+        for record in self.unwritten().values():
+            if record.mod_message_id == mod_message_id:
+                return record
+        row = self.db.execute("SELECT data FROM reports WHERE mod_message_id = ? LIMIT 1", (mod_message_id,)).fetchone()
+        return ReportRecord.from_dict(json.loads(row[0])) if row else None
+
+    def find(self, author_id=None, guild_id=None, category=None, status=None, limit=50):
+        '''Most recent records matching every given field, newest first. Pending writes are included.'''
+        filters = (("author_id", author_id), ("guild_id", guild_id), ("category", category), ("status", status))
+        clauses, params = [], []
+        for column, value in filters:
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        unwritten = self.unwritten()
+        rows = self.db.execute(
+            f"SELECT data FROM reports {where} ORDER BY created DESC LIMIT ?", (*params, limit + len(unwritten))
+        ).fetchall()
+        records = {}
+        for row in rows:
+            record = ReportRecord.from_dict(json.loads(row[0]))
+            records[record.report_id] = record
+        # Overlay what hasn't been written yet instead of writing it here, on the event loop
+        for report_id, record in unwritten.items():
+            if all(value is None or getattr(record, column) == value for column, value in filters):
+                records[report_id] = record
+            else:
+                records.pop(report_id, None)
+        return sorted(records.values(), key=lambda record: record.created or 0, reverse=True)[:limit]
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error writing reports to {self.path}: {e}")
+
+    async def flush(self):
+        batch, rows = self.take_batch()
+        if rows:
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(self.writer, self.write_rows, rows)
+            except Exception:
+                self.requeue(batch)
+                raise
+            finally:
+                self.writing = {}
+
+    def take_batch(self):
+        # Serialise on the event loop so the writer thread never sees a record while it's being updated
+        batch, self.pending = self.pending, {}
+        self.writing.update(batch)
+        return batch, [self.row(report_id, record) for report_id, record in batch.items()]
+
+    def row(self, report_id, record):
+        # Every column but seq, which the writer assigns
+        return (report_id, record.author_id, record.guild_id, record.category, record.status, record.created,
+                json.dumps(record.to_dict(), separators=(",", ":")), record.mod_message_id, record.message_id)
+
+    def requeue(self, batch):
+        # Keep failed writes for the next flush unless a newer version has been queued since
+        for report_id, record in batch.items():
+            self.pending.setdefault(report_id, record)
+
+    def write_rows(self, rows):
+        with self.flush_lock, self.write_db:
+            seq = self.next_seq()
+            self.write_db.executemany(self.UPSERT, [(*row, seq) for row in rows])
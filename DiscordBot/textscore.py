@@ -0,0 +1,151 @@
+# textscore.py
+import json
+import math
+import re
+
+from report import Report
+
+# Extra phrases per (category, subtype) on top of the subtype names themselves, with how much each counts
+# towards that subtype's score. A subtype's score is 1 - exp(-sum of its distinct matched weights); a phrase that
+# is often innocent on its own ("suicide squad", "al gore") weighs under 0.9, which scores below
+# bot.text_threshold, so it can't get a message auto-flagged without something else matching too.
+LEXICON = {
+    ("harassment", "bullying"): [("kill yourself", 2.0), ("kys", 1.5), ("nobody likes you", 1.0),
+                                  ("you're worthless", 1.0), ("you are worthless", 1.0), ("loser", 0.3)],
+    ("harassment", "hate speech"): [("go back to your country", 1.5), ("subhuman", 1.5), ("vermin", 0.7)],
+    ("harassment", "stalking"): [("i know where you live", 2.0), ("i'm watching you", 1.2), ("i am watching you", 1.2),
+                                  ("followed you home", 1.5)],
+    ("harassment", "doxxing"): [("home address", 0.6), ("your address is", 1.5), ("leaked your", 1.0), ("dox", 1.2)],
+    ("fraud", "phishing"): [("free nitro", 1.5), ("verify your account", 1.2), ("steam gift", 1.0),
+                            ("claim your reward", 1.0), ("log in here", 0.8), ("seed phrase", 1.5)],
+    ("fraud", "investment"): [("guaranteed returns", 1.5), ("double your", 1.0), ("crypto giveaway", 1.5),
+                              ("100x", 0.8), ("dm me to invest", 1.5)],
+    ("fraud", "impersonation"): [("official discord staff", 1.5), ("i am a moderator", 0.8), ("discord support team", 1.2)],
+    ("fraud", "malware"): [("download this exe", 1.5), ("run this script", 0.8), ("disable your antivirus", 1.5)],
+    ("inappropriate content", "sexual - adult"): [("nudes", 1.2), ("onlyfans", 1.0), ("nsfw", 0.6)],
+    ("inappropriate content", "violence"): [("gore", 0.6), ("beheading", 1.5)],
+    ("disinformation", "health"): [("vaccines cause", 1.5), ("miracle cure", 1.2), ("cures cancer", 1.2)],
+    ("disinformation", "political"): [("election was stolen", 1.5), ("rigged election", 1.2)],
+    ("spam", "mass messaging"): [("@everyone", 0.6), ("@here", 0.4), ("join my server", 0.8)],
+    ("immediate threat", "suicidal intent"): [("kill myself", 2.5), ("want to die", 2.0), ("end my life", 2.5),
+                                              ("suicide", 0.7), ("better off dead", 1.5)],
+    ("immediate threat", "self-harm intent"): [("hurt myself", 2.0), ("cut myself", 2.5), ("self harm", 1.2)],
+    ("immediate threat", "violence towards others"): [("i will kill you", 2.5), ("i'm going to kill you", 2.5),
+                                                      ("shoot up", 2.5), ("bomb the", 2.0)],
+}
+
+# Weight of a subtype's own name showing up in a message, e.g. "phishing"
+SUBTYPE_NAME_WEIGHT = 0.5
+
+# Where "discord" followed by a dot is the real thing: Discord's own domains and the common client libraries
+DISCORD_DOMAINS = ("discord.com", "discord.gg", "discord.gift", "discord.gifts", "discord.media", "discord.new",
+                   "discord.dev", "discord.co", "discord.store", "discord.design", "discordapp.com", "discordapp.net",
+                   "discordstatus.com", "discordmerch.com")
+DISCORD_LIBRARIES = ("discord.py", "discord.js", "discord.net", "discord.jl")
+
+# A discord-ish domain that isn't one of the above, either spelled with lookalike characters (dlscord.com,
+# disc0rd.gg) or registered elsewhere (discord-nitro.ru, discord.gg.ru)
+LOOKALIKE_DOMAIN = re.compile(
+    rf"\b(?!(?:{'|'.join(map(re.escape, DISCORD_DOMAINS + DISCORD_LIBRARIES))})(?!\.?[\w-]))"
+    r"d[il1]sc[o0]rd[\w-]*\.[a-z]{2,}\b"
+)
+
+# Non-literal patterns: (name shown to mods, substring the text must contain for the regex to be worth running,
+# compiled regex, category, subtype, weight)
+PATTERNS = [
+    ("repeated characters", "", re.compile(r"(.)\1{14,}"), "spam", "off-topic flooding", 0.6),
+    ("link dump", "://", re.compile(r"(?:https?://\S+\s+){3}https?://"), "spam", "mass messaging", 1.0),
+    ("lookalike discord domain", "rd", LOOKALIKE_DOMAIN, "fraud", "phishing", 2.0),
+]
+
+
+def trie_pattern(phrases):
+    '''
+    Regex source matching any of phrases, factored into a prefix trie ("kill (?:myself|yourself)" rather than
+    "kill myself|kill yourself") so the engine rejects most positions after a character or two instead of trying
+    every phrase in turn. Longer phrases win over phrases that are their prefixes.
+    '''
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        ends = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 and len(branches[0]) == 1 else f"(?:{'|'.join(branches)})"
+        return f"{body}?" if ends else body
+
+    return build(trie)
+
+
+class TextVerdict:
+    __slots__ = ("score", "category", "subtype", "terms")
+
+    def __init__(self, score, category, subtype, terms):
+        self.score = score
+        self.category = category
+        self.subtype = subtype
+        self.terms = terms
+
+
+class TextScorer:
+    '''
+    In-process text scorer for group channel messages. Every phrase in LEXICON, plus the subtype names from
+    Report.CATEGORIES, is compiled into a single regex alternation, so a message is scanned once however big the
+    vocabulary gets; a handful of PATTERNS catch what phrases can't (flooding, link dumps, lookalike domains).
+
+    Optionally, a linear bag-of-words model (JSON: {"bias": b, "weights": {token: w}, "category": c,
+    "subtype": s}) adds its sigmoid score as one more candidate, for vocab the lexicon doesn't cover.
+    '''
+
+    def __init__(self, lexicon=LEXICON, patterns=PATTERNS, model_path=None):
+        self.phrases = {} # lowercased phrase -> list of (category, subtype, weight)
+        for category, subtypes in Report.CATEGORIES.items():
+            for subtype in subtypes:
+                self.phrases.setdefault(subtype, []).append((category, subtype, SUBTYPE_NAME_WEIGHT))
+        for (category, subtype), entries in lexicon.items():
+            for phrase, weight in entries:
+                self.phrases.setdefault(phrase.lower(), []).append((category, subtype, weight))
+
+        self.automaton = re.compile(rf"(?<!\w)(?:{trie_pattern(self.phrases)})(?!\w)")
+        self.patterns = patterns
+        self.model = None
+        if model_path:
+            with open(model_path) as f:
+                self.model = json.load(f)
+
+    def score(self, text):
+        '''Returns the TextVerdict for the most likely subtype, or None if nothing matched.'''
+        if not text:
+            return None
+        text = text.lower()
+        totals = {} # (category, subtype) -> summed weight
+        terms = {} # (category, subtype) -> matched phrases
+        for match in set(self.automaton.findall(text)):
+            for category, subtype, weight in self.phrases[match]:
+                totals[(category, subtype)] = totals.get((category, subtype), 0) + weight
+                terms.setdefault((category, subtype), []).append(match)
+        for name, hint, pattern, category, subtype, weight in self.patterns:
+            if hint in text and pattern.search(text):
+                totals[(category, subtype)] = totals.get((category, subtype), 0) + weight
+                terms.setdefault((category, subtype), []).append(name)
+
+        best = None
+        if totals:
+            key = max(totals, key=totals.get)
+            best = TextVerdict(1 - math.exp(-totals[key]), key[0], key[1], terms[key])
+        if self.model is not None:
+            model_score = self.model_score(text)
+            if best is None or model_score > best.score:
+                best = TextVerdict(model_score, self.model["category"], self.model["subtype"], [])
+        return best
+
+    def model_score(self, text):
+        weights = self.model["weights"]
+        z = self.model.get("bias", 0.0) + sum(weights.get(token, 0.0) for token in set(re.findall(r"\w+", text)))
+        return 1 / (1 + math.exp(-z))
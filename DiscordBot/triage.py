@@ -0,0 +1,185 @@
+# triage.py
+import re
+import struct
+import time
+from collections import Counter
+
+# Images with a longest side under this many pixels (emoji, stickers, icons) are too small to judge
+MIN_SIDE = 128
+# Attachments under this many bytes are too small to judge
+MIN_BYTES = 2048
+# Banners and strips this elongated aren't something the model was trained on
+MAX_ASPECT = 8
+
+# Confidence reported for an image whose metadata names an image generator
+GENERATOR_SCORE = 1.0
+
+# Matched, lowercased, against the metadata (EXIF, XMP, PNG text, C2PA manifests) of downloaded images.
+# trainedAlgorithmicMedia / compositeSynthetic are the IPTC digital source types generators write into XMP and
+# C2PA manifests; the rest are the software names generators put in the Software / claim_generator fields.
+GENERATOR_SIGNATURES = (
+    b"trainedalgorithmicmedia",
+    b"compositesynthetic",
+    b"midjourney",
+    b"dall-e",
+    b"dall\xc2\xb7e",
+    b"stable diffusion",
+    b"stablediffusion",
+    b"novelai",
+    b"adobe firefly",
+    b"comfyui",
+    b"invokeai",
+)
+# PNG text chunk keywords written by Stable Diffusion front ends (A1111, ComfyUI, InvokeAI, ...)
+PNG_GENERATOR_KEYS = {b"parameters", b"prompt", b"workflow", b"invokeai_metadata", b"sd-metadata", b"dream"}
+
+# Default names generators and their front ends give saved images, as Discord stores them (spaces become
+# underscores, "·" is dropped): ComfyUI_00042_.png, DALLE_2024-05-01_12.00.00_-_a_cat.png, A1111's
+# 00012-1234567890.png (index-seed) and Midjourney's user_a_cat_in_space_<uuid>.png
+GENERATOR_FILENAME = re.compile(
+    r"^(?:comfyui_\d+|dall-?e_\d{4}-\d\d-\d\d|\d{5}-\d{6,}|.+_[0-9a-f]{8}-(?:[0-9a-f]{4}-){3}[0-9a-f]{12})", re.I
+)
+# Confidence reported for an image whose file name is all we have to go on (see generator_filename)
+FILENAME_SCORE = 0.75
+
+# Bytes of an original fetched just for its headers when the image itself is downloaded through the resizing media
+# proxy, whose re-encoded copies drop the metadata. PNG text/C2PA chunks, JPEG APPn segments and the animation
+# markers all come before the image data; WebP keeps EXIF/XMP after it, so those aren't seen this way.
+METADATA_PREFIX_BYTES = 64 * 1024
+
+# Formats whose metadata is in that prefix, so fetching it is worth a request
+METADATA_PREFIX_TYPES = {"image/png", "image/jpeg", "image/jpg"}
+
+# What to do with an image
+SKIP = "skip" # don't score it
+FLAG = "flag" # score it GENERATOR_SCORE without asking the endpoint
+FORWARD = "forward" # send it to the endpoint
+
+# Running totals, see benchmarks/bench_triage.py
+stats = Counter()
+
+
+def screen_attachment(attachment):
+    '''
+    Checks an attachment's size and dimensions, as reported by Discord, before anything is downloaded.
+    Returns the reason to skip it, or None if it should be downloaded and inspected.
+    '''
+    stats['screened'] += 1
+    reason = None
+    width, height = attachment.width, attachment.height
+    if attachment.size is not None and attachment.size < MIN_BYTES:
+        reason = "too_few_bytes"
+    elif width and height and max(width, height) < MIN_SIDE:
+        reason = "too_small"
+    elif width and height and max(width, height) > MAX_ASPECT * min(width, height):
+        reason = "aspect_ratio"
+    if reason:
+        stats[f'skip_{reason}'] += 1
+    return reason
+
+
+def generator_filename(filename):
+    '''
+    Whether an attachment's file name is an image generator's default. Much weaker evidence than metadata, but it
+    costs nothing: this is what the auto-flag path falls back on when it's too loaded to download images.
+    '''
+    if filename and GENERATOR_FILENAME.match(filename):
+        stats['generator_filename'] += 1
+        return True
+    return False
+
+
+def inspect_image(data):
+    '''
+    Looks at the container headers of downloaded image bytes, without decoding any pixels. Returns
+    (action, reason): SKIP for animations, FLAG when the metadata names a known image generator or an
+    AI digital source type, FORWARD otherwise.
+
+    Discord's media proxy re-encodes the images it resizes, which can drop their metadata, so for those the
+    classifier also passes the first METADATA_PREFIX_BYTES of PNG and JPEG originals; truncated data is fine.
+    '''
+    start = time.perf_counter_ns()
+    action, reason = FORWARD, None
+    try:
+        metadata, animated, generator_key, c2pa = read_metadata(data)
+    except (struct.error, IndexError, ValueError):
+        # Truncated or unusual container: leave it to PIL and the model
+        metadata, animated, generator_key, c2pa = [], False, False, False
+    if c2pa:
+        stats['c2pa'] += 1
+
+    if animated:
+        action, reason = SKIP, "animated"
+    elif generator_key:
+        action, reason = FLAG, "generator_parameters"
+    else:
+        blob = b"\n".join(metadata).lower()
+        for signature in GENERATOR_SIGNATURES:
+            if signature in blob:
+                action, reason = FLAG, "generator_signature"
+                break
+
+    stats['inspected'] += 1
+    stats['inspect_ns'] += time.perf_counter_ns() - start
+    stats[f'{action}_{reason}' if reason else FORWARD] += 1
+    return action, reason
+
+
+def read_metadata(data):
+    '''Returns (metadata segments, animated, has generator text keys, has C2PA manifest) for PNG/JPEG/WebP/GIF.'''
+    metadata = []
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        # Metadata and the animation control chunk come before the image data, so stop at the first IDAT
+        i = 8
+        while i + 8 <= len(data):
+            length, chunk_type = struct.unpack(">I4s", data[i:i + 8])
+            body = data[i + 8:i + 8 + length]
+            if chunk_type == b"IDAT":
+                break
+            if chunk_type == b"acTL":
+                return metadata, True, False, False
+            if chunk_type in (b"tEXt", b"iTXt", b"zTXt"):
+                if body.split(b"\0", 1)[0].lower() in PNG_GENERATOR_KEYS:
+                    return metadata, False, True, False
+                if chunk_type != b"zTXt":
+                    metadata.append(body)
+            elif chunk_type in (b"eXIf", b"caBX"):
+                metadata.append(body)
+            i += 12 + length
+        return metadata, False, False, any(b"c2pa" in segment for segment in metadata)
+
+    if data[:2] == b"\xff\xd8":
+        # APPn and COM segments up to the start of scan; C2PA manifests live in APP11 (JUMBF)
+        c2pa = False
+        i = 2
+        while i + 4 <= len(data) and data[i] == 0xFF:
+            marker = data[i + 1]
+            if marker in (0xDA, 0xD9):
+                break
+            if 0xD0 <= marker <= 0xD7 or marker in (0x01, 0xFF):
+                i += 1 if marker == 0xFF else 2
+                continue
+            length = struct.unpack(">H", data[i + 2:i + 4])[0]
+            if 0xE0 <= marker <= 0xEF or marker == 0xFE:
+                segment = data[i + 4:i + 2 + length]
+                metadata.append(segment)
+                c2pa = c2pa or (marker == 0xEB and b"c2pa" in segment)
+            i += 2 + length
+        return metadata, False, False, c2pa
+
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        i = 12
+        while i + 8 <= len(data):
+            fourcc, size = struct.unpack("<4sI", data[i:i + 8])
+            if fourcc == b"ANIM":
+                return metadata, True, False, False
+            if fourcc in (b"EXIF", b"XMP "):
+                metadata.append(data[i + 8:i + 8 + size])
+            i += 8 + size + (size & 1)
+        return metadata, False, False, False
+
+    if data[:4] == b"GIF8":
+        # The looping extension sits right after the global colour table in practically every animated GIF
+        return metadata, b"NETSCAPE2.0" in data[:4096], False, False
+
+    return metadata, False, False, False